@@ -1,10 +1,53 @@
 """A set of functions to retrieve and save Square data into MongoDB.
+
+The public classes are imported on first use, so importing the package does
+not load the Square and MongoDB clients until they are needed.
 """
-from squaredown.catalog import Catalog
-from squaredown.connector import Connector
-from squaredown.locations import Locations
-from squaredown.orders import Orders
-from squaredown.report_data import ReportData
+from importlib import import_module
+from typing import TYPE_CHECKING
 
+# bind the public classes for type checkers and linters, without importing
+if TYPE_CHECKING:
+    from squaredown.catalog import Catalog
+    from squaredown.connector import Connector
+    from squaredown.locations import Locations
+    from squaredown.orders import Orders
+    from squaredown.report_data import ReportData
 
 __version__ = "1.7.2"
+
+# public classes and their modules
+_CLASS_MODULES = {
+    'Catalog': 'squaredown.catalog',
+    'Connector': 'squaredown.connector',
+    'Locations': 'squaredown.locations',
+    'Orders': 'squaredown.orders',
+    'ReportData': 'squaredown.report_data',
+}
+
+__all__ = list(_CLASS_MODULES)
+
+
+def __getattr__(name):
+    """Imports the public class with the specified name.
+
+    Args:
+        name: Name of the public class.
+
+    Returns:
+        The public class.
+    """
+    module_name = _CLASS_MODULES.get(name)
+    if not module_name:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    cls = getattr(import_module(module_name), name)
+    globals()[name] = cls
+
+    return cls
+
+
+def __dir__():
+    """Lists the module attributes, including the public classes.
+    """
+    return sorted(set(globals()) | set(_CLASS_MODULES))
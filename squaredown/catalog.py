@@ -1,12 +1,33 @@
 """Catalog class module for Squaredown.
 """
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import logging
+from operator import itemgetter
+
 from aracnid_logger import Logger
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
 
-from squaredown.connector import Connector
+from squaredown.connector import BATCH_SIZE, BULK_WRITE_CONCERN, Connector
 
 # initialize logging
 logger = Logger(__name__).get_logger()
 
+# sort key for Square Catalog objects
+UPDATED_AT = itemgetter('updated_at')
+
+# Square Catalog object type for each catalog collection
+OBJECT_TYPES = {
+    'square_catalog_categories': 'CATEGORY',
+    'square_catalog_items': 'ITEM',
+    'square_catalog_item_variations': 'ITEM_VARIATION',
+    'square_catalog_taxes': 'TAX',
+    'square_catalog_discounts': 'DISCOUNT',
+    'square_catalog_modifiers': 'MODIFIER',
+    'square_catalog_modifier_lists': 'MODIFIER_LIST',
+}
+
 
 class Catalog(Connector):
     """Contains the code to connect and pull catalog items from Square
@@ -16,8 +37,10 @@ class Catalog(Connector):
         None.
 
     Attributes:
+        bulk_collection: Square Catalog collection used for bulk upserts.
         collection: Square Catalog collection in MongoDB.
         collection_name: Name of the Square Catalog collection in MongoDB.
+        data_field: Name of the object type specific data field.
         object_type: Object type of the Square Catalog object.
     """
 
@@ -30,11 +53,16 @@ class Catalog(Connector):
         """
         self.collection_name = collection_name
         self.object_type = self.get_object_type(collection_name)
-        logger.debug(f'collection_name: {self.collection_name}')
+        self.data_field = None
+        if self.object_type:
+            self.data_field = f'{self.object_type.lower()}_data'
+        logger.debug('collection_name: %s', self.collection_name)
         super().__init__(config_name=self.collection_name)
 
         # initialize MongoDB collection
         self.collection = self.mdb.read_collection(self.collection_name)
+        self.bulk_collection = self.collection.with_options(
+            write_concern=BULK_WRITE_CONCERN)
 
     def pull(self, save_last=True, **kwargs):
         """Retrieves a set of Square objects for the specified `collection`
@@ -54,7 +82,7 @@ class Catalog(Connector):
             None
         """
         start, end = self.timespan(collection=self.collection_name, **kwargs)
-        logger.debug(f'timespan: {start}, {end}')
+        logger.debug('timespan: %s, %s', start, end)
 
         square_filter = {
             'object_types': [self.object_type],
@@ -62,37 +90,131 @@ class Catalog(Connector):
             'include_deleted_objects': True
         }
 
-        objects = self.search('objects', square_filter)
+        # process and sort each page while the next one is retrieved
+        pages = []
+        saved_updated_at = {}
+        for page in self.search_pages('objects', square_filter):
+            for obj in page:
+                self.process_obj(obj)
+            page.sort(key=UPDATED_AT)
+            pages.append(page)
+
+            # read the update times of the objects already saved
+            saved_updated_at.update(
+                self.read_updated_at(
+                    self.collection, [obj['_id'] for obj in page]))
 
         update_count = 0
-        if objects:
-            for obj in sorted(objects, key=lambda o: o['updated_at']):
-                obj_id = obj['id']
-                updated_at = self.decode_datetime(obj['updated_at'])
-
-                # check last updated object for duplicate
-                if update_count == 0:
-                    if obj_id == self.props.last_id:
-                        if updated_at == self.props.last_updated:
-                            continue
-
-                self.update_obj(obj)
+        ops = []
+        if any(pages):
+            for obj in heapq.merge(*pages, key=UPDATED_AT):
+                obj_id = obj['_id']
+                updated_at = obj['updated_at']
+
+                # skip objects that have not changed since they were saved
+                if saved_updated_at.get(obj_id) == updated_at:
+                    continue
+
+                ops.append(ReplaceOne({'_id': obj_id}, obj, upsert=True))
                 update_count += 1
 
-                # update config properties
-                if save_last:
-                    self.props.last_updated = updated_at
-                    self.props.last_id = obj_id
-                    self.props.update()
+                # save the batch
+                if len(ops) >= BATCH_SIZE:
+                    if not self.save_batch(ops, save_last, obj_id, updated_at):
+                        return
 
                 # debug, only process one obj
                 # break
 
-        logger.debug(f'objects processed: {update_count}')
+            # save the remaining objects, including the last object retrieved
+            if not self.save_batch(ops, save_last, obj_id, updated_at):
+                return
+
+        logger.debug('objects processed: %s', update_count)
+
+    @classmethod
+    def pull_many(cls, collection_names=None, max_workers=4, **kwargs):
+        """Pulls several Square Catalog collections concurrently.
+
+        Each collection is pulled by its own Catalog Connector in a separate
+        thread, so the Square requests of one collection overlap with the
+        MongoDB writes of another. All threads share the same MongoDB client.
+
+        Args:
+            collection_names: List of catalog collection names to pull,
+                defaults to all of the catalog collections.
+            max_workers: Maximum number of collections pulled at the same time.
+            **kwargs: keyword arguments passed to pull()
+
+        Returns:
+            None
+        """
+        if collection_names is None:
+            collection_names = list(OBJECT_TYPES)
+
+        def pull_collection(collection_name):
+            cls(collection_name).pull(**kwargs)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(pull_collection, name)
+                           for name in collection_names]:
+                future.result()
+
+    def save_batch(self, ops, save_last, last_id, last_updated):
+        """Saves a batch of Square Catalog objects into MongoDB.
+
+        The configuration properties are only updated after the batch has been
+        written, so a failed batch will be pulled again on the next run. The
+        batch is written with a primary-only write concern, while the
+        configuration properties keep the default write concern.
+
+        Args:
+            ops: List of MongoDB write operations.
+            save_last (bool): if set to True, details of the last object in the
+                batch are saved in the configuration properties
+            last_id: Identifier of the last object in the batch.
+            last_updated: Update time of the last object in the batch.
+
+        Returns:
+            True if the batch was saved, otherwise False.
+        """
+        if ops:
+            try:
+                self.flush_batch(self.bulk_collection, ops)
+            except BulkWriteError as err:
+                logger.error(f'Error saving catalog objects ({self.collection_name})')
+                logger.error(err.details.get('writeErrors'))
+                return False
+
+        # update config properties
+        if save_last:
+            self.save_props(last_updated=last_updated, last_id=last_id)
+
+        return True
 
     def update_obj(self, obj):
         """Save the provided Square Catalog Object into MongoDB.
 
+        Args:
+            obj: Square Catalog object
+
+        Returns:
+            The MongoDB representation of the Square Catalog object
+        """
+        self.process_obj(obj)
+
+        # save the object to mdb
+        self.collection.replace_one(
+            filter={'_id': obj['_id']},
+            replacement=obj,
+            upsert=True
+        )
+
+        return obj
+
+    def process_obj(self, obj):
+        """Prepares the provided Square Catalog Object to be saved in MongoDB.
+
         Args:
             obj: Square Catalog object
 
@@ -106,19 +228,14 @@ class Catalog(Connector):
         updated_at = obj.get('updated_at')
 
         # log the update
-        logger.info(f'update_catalog_object {obj_id} ({self.collection_name}): '
-            f'{updated_at.isoformat()[0:16]}')
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('update_catalog_object %s (%s): %s',
+                obj_id, self.collection_name,
+                updated_at.strftime('%Y-%m-%dT%H:%M'))
 
         # apply object customizations
         self.apply_object_customizations(obj)
 
-        # save the object to mdb
-        self.collection.find_one_and_replace(
-            filter={'_id': obj_id},
-            replacement=obj,
-            upsert=True
-        )
-
         return obj
 
     @staticmethod
@@ -131,24 +248,7 @@ class Catalog(Connector):
         Returns:
             Square Catalog object type.
         """
-        object_type = None
-
-        if collection_name == 'square_catalog_categories':
-            object_type = 'CATEGORY'
-        elif collection_name == 'square_catalog_items':
-            object_type = 'ITEM'
-        elif collection_name == 'square_catalog_item_variations':
-            object_type = 'ITEM_VARIATION'
-        elif collection_name == 'square_catalog_taxes':
-            object_type = 'TAX'
-        elif collection_name == 'square_catalog_discounts':
-            object_type = 'DISCOUNT'
-        elif collection_name == 'square_catalog_modifiers':
-            object_type = 'MODIFIER'
-        elif collection_name == 'square_catalog_modifier_lists':
-            object_type = 'MODIFIER_LIST'
-
-        return object_type
+        return OBJECT_TYPES.get(collection_name)
 
     def apply_object_customizations(self, obj):
         """Apply customizations to the Square Catalog object.
@@ -162,9 +262,10 @@ class Catalog(Connector):
         Returns:
             None.
         """
-        logger.debug(f'Applying default customizations: {self.collection_name}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Applying default customizations: %s', self.collection_name)
 
         # flatten catalog data
-        field_name = f'{self.object_type.lower()}_data'
-        obj.update(obj[field_name])
-        obj.pop(field_name)
+        data = obj.pop(self.data_field, None)
+        if data:
+            obj.update(data)
@@ -2,19 +2,61 @@
 """
 from datetime import datetime
 import os
+import re
+from threading import Lock
 
 from aracnid_config import Config
 from aracnid_logger import Logger
-from aracnid_utils import timespan as ts
+from aracnid_utils import EST, timespan as ts
 from i_mongodb import MongoDBInterface
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
 
-from squaredown.i_square import SquareInterface
+from squaredown.i_square import SquareInterface, shared_lock
 
 # initialize logging
 logger = Logger(__name__).get_logger()
 
 logger.debug('module installed')
 
+# number of write operations sent to MongoDB per bulk write
+BATCH_SIZE = 500
+
+# write concern for the queued upserts, which are acknowledged by the primary
+# so write errors are still reported, but do not wait for the journal
+BULK_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# ISO-8601 notations that are left to the generic timespan function
+ISOWEEK_RE = re.compile(r'^\d{4}-W\d{2}$')
+ISODATE_ONLY_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def parse_iso_datetime(dt_str):
+    """Parses an ISO-8601 datetime string into an Eastern datetime.
+
+    This uses datetime.fromisoformat(), which is much faster than the generic
+    parser used by the timespan function. Week and date-only strings are not
+    parsed, because the timespan function adjusts their endpoints.
+
+    Args:
+        dt_str: String representing a datetime.
+
+    Returns:
+        Datetime object, or None if the string is not an ISO-8601 datetime.
+    """
+    if ISOWEEK_RE.match(dt_str) or ISODATE_ONLY_RE.match(dt_str):
+        return None
+
+    try:
+        dtx = datetime.fromisoformat(dt_str)
+    except ValueError:
+        return None
+
+    if dtx.tzinfo is None or dtx.tzinfo.utcoffset(dtx) is None:
+        return EST.localize(dtx)
+
+    return dtx.astimezone(EST)
+
 
 class Connector(SquareInterface, MongoDBInterface):
     """Provides interfaces to Square and MongoDB to enable data exchange.
@@ -25,13 +67,29 @@ class Connector(SquareInterface, MongoDBInterface):
 
     Environment Variables:
         SQUAREDOWN_START_STR: The minimum start time for Connector operations.
+        SQUARE_LOCATIONS: List of Square Locations to process.
+
+    Write operations can be queued per collection with queue_op() and are
+    only sent to MongoDB by flush().
 
     Attributes:
+        collections: MongoDB collections already resolved, by name.
         config_name: Name of the configuration object in MongoDB.
+        pending_lock: Lock that guards the queued write operations.
+        pending_ops: Queued MongoDB write operations by collection name.
         props: Configuration Properties object.
         start_min: Minimum start time to process objects
     """
 
+    # configuration properties, shared by all connectors with the same name
+    _configs = {}
+
+    # Square location identifiers, shared by all connectors
+    _location_ids = None
+
+    # minimum start time, shared by all connectors
+    _start_min = None
+
     def __init__(self, config_name=None):
         """Initializes the interfaces and instance attributes.
         """
@@ -40,16 +98,180 @@ class Connector(SquareInterface, MongoDBInterface):
 
         # initialize MongoDB interface
         MongoDBInterface.__init__(self)
-        self.mdb = MongoDBInterface().get_mdb()
+        self.mdb = self.get_mdb()
 
-        # initialize configuration properties
+        # initialize configuration properties, sharing the MongoDB database
         self.config_name = config_name
         if config_name:
-            logger.debug(f'config_name: {self.config_name}')
-            self.props = Config(self.config_name)
+            logger.debug('config_name: %s', self.config_name)
+            self.props = self.get_config(self.config_name, self.mdb)
 
         self.set_start_min()
 
+        # initialize the queued write operations
+        self.pending_lock = Lock()
+        self.pending_ops = {}
+        self.collections = {}
+
+    @staticmethod
+    def get_location_ids():
+        """Returns the Square location identifiers to process.
+
+        The identifiers are read from the SQUARE_LOCATIONS environment variable
+        the first time they are requested in this process.
+
+        Returns:
+            List of Square location identifiers.
+        """
+        with shared_lock:
+            if Connector._location_ids is None:
+                Connector._location_ids = (
+                    os.environ.get('SQUARE_LOCATIONS').split(','))
+
+        return Connector._location_ids
+
+    @staticmethod
+    def get_config(config_name, mdb):
+        """Returns the configuration properties with the specified name.
+
+        The properties are only loaded from MongoDB the first time they are
+        requested in this process, so every connector with the same name shares
+        them and sees the updates made by the others.
+
+        Args:
+            config_name: Name of the configuration object in MongoDB.
+            mdb: MongoDB database that contains the configuration objects.
+
+        Returns:
+            Configuration Properties object.
+        """
+        props = Connector._configs.get(config_name)
+        if props is None:
+            props = Connector._configs.setdefault(
+                config_name, Config(config_name, mdb=mdb))
+
+        return props
+
+    @staticmethod
+    def flush_batch(collection, ops):
+        """Writes a batch of MongoDB write operations and clears the batch.
+
+        The operations are written unordered, because each one replaces a
+        separate document.
+
+        Args:
+            collection: MongoDB collection to write.
+            ops: List of MongoDB write operations.
+
+        Returns:
+            None
+        """
+        if ops:
+            collection.bulk_write(ops, ordered=False)
+            ops.clear()
+
+    @staticmethod
+    def read_updated_at(collection, obj_ids):
+        """Returns the update times of Square objects saved in MongoDB.
+
+        Only the "updated_at" field is retrieved, so the saved objects do not
+        need to be read in full to check for duplicates.
+
+        Args:
+            collection: MongoDB collection of the Square objects.
+            obj_ids: List of Square object identifiers.
+
+        Returns:
+            Dictionary of update times keyed by object identifier.
+        """
+        if not obj_ids:
+            return {}
+
+        cursor = collection.find(
+            filter={'_id': {'$in': obj_ids}},
+            projection={'updated_at': 1}
+        )
+
+        return {doc['_id']: doc.get('updated_at') for doc in cursor}
+
+    def get_collection(self, collection_name):
+        """Returns the MongoDB collection with the specified name.
+
+        The collection is only resolved the first time it is requested, so the
+        queued writes of every flush reuse the same collection object. The
+        collection uses the bulk write concern.
+
+        Args:
+            collection_name: Name of the MongoDB collection.
+
+        Returns:
+            The MongoDB collection.
+        """
+        collection = self.collections.get(collection_name)
+        if collection is None:
+            collection = self.collections.setdefault(
+                collection_name,
+                self.mdb.read_collection(collection_name).with_options(
+                    write_concern=BULK_WRITE_CONCERN))
+
+        return collection
+
+    def queue_op(self, collection_name, op):
+        """Queues a MongoDB write operation until the next flush().
+
+        Args:
+            collection_name: Name of the MongoDB collection to write.
+            op: MongoDB write operation.
+
+        Returns:
+            None
+        """
+        with self.pending_lock:
+            self.pending_ops.setdefault(collection_name, []).append(op)
+
+    def flush(self):
+        """Writes the queued MongoDB write operations of every collection.
+
+        Each collection is written with a single bulk write. The writes are
+        not grouped in a transaction, since the duplicate key errors of FIXED
+        orders would abort it and transactions are not available on standalone
+        servers.
+
+        Returns:
+            None
+        """
+        with self.pending_lock:
+            if not any(self.pending_ops.values()):
+                return
+
+            for collection_name, ops in self.pending_ops.items():
+                try:
+                    self.flush_batch(self.get_collection(collection_name), ops)
+                except BulkWriteError as err:
+                    ops.clear()
+                    if self.handle_write_errors(collection_name,
+                            err.details.get('writeErrors', [])):
+                        raise
+
+    def handle_write_errors(self, collection_name, write_errors):
+        """Handles the errors of the queued writes of a collection.
+
+        The write operations are unordered, so the other operations have been
+        written. This method can be overridden to handle expected errors.
+
+        Args:
+            collection_name: Name of the MongoDB collection written.
+            write_errors: List of write errors reported by MongoDB.
+
+        Returns:
+            List of the write errors that were not handled.
+        """
+        if write_errors:
+            logger.error(f'Error saving objects ({collection_name})')
+            logger.error(write_errors)
+
+        return write_errors
+
     def set_start_min(self):
         """Sets an attribute for the minimum start time.
 
@@ -58,8 +280,42 @@ class Connector(SquareInterface, MongoDBInterface):
         Args:
             None
         """
-        start_str = os.environ.get('SQUAREDOWN_START_STR')
-        self.start_min = datetime.fromisoformat(start_str).astimezone()
+        self.start_min = self.get_start_min()
+
+    @staticmethod
+    def get_start_min():
+        """Returns the minimum start time to process objects.
+
+        The time is parsed from the SQUAREDOWN_START_STR environment variable
+        and converted to the local time zone the first time it is requested in
+        this process.
+
+        Returns:
+            Datetime object of the minimum start time.
+        """
+        with shared_lock:
+            if Connector._start_min is None:
+                start_str = os.environ.get('SQUAREDOWN_START_STR')
+                Connector._start_min = (
+                    datetime.fromisoformat(start_str).astimezone())
+
+        return Connector._start_min
+
+    def save_props(self, **props):
+        """Saves the specified configuration properties in a single update.
+
+        The properties are written straight into the property dictionary,
+        bypassing the attribute interface of the Config object, which saves the
+        entire property set on every assignment.
+
+        Args:
+            props: Keyword arguments with the property names and values.
+
+        Returns:
+            None
+        """
+        self.props.props.update(props)
+        self.props.update()
 
     def timespan(self, **kwargs):
         """Calculates the endpoints of a timespan.
@@ -80,6 +336,14 @@ class Connector(SquareInterface, MongoDBInterface):
         if not begin and not begin_str and not week_str:
             kwargs['begin'] = self.datetime_begin()
 
+        # parse ISO-8601 datetime strings without the generic parser
+        for dt_key in ('begin', 'thru'):
+            dt_str = kwargs.get(f'{dt_key}_str')
+            if dt_str and not kwargs.get(dt_key):
+                dtx = parse_iso_datetime(dt_str)
+                if dtx:
+                    kwargs[dt_key] = dtx
+
         return ts(**kwargs)
 
     def datetime_begin(self):
@@ -91,7 +355,7 @@ class Connector(SquareInterface, MongoDBInterface):
         Returns:
             Datetime object that represents the start time of the timespan.
         """
-        last_updated = self.props.last_updated
+        last_updated = self.props.props.get('last_updated')
 
         if last_updated:
             return last_updated
@@ -1,15 +1,267 @@
 """Class module to interface with Square.
 """
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain
 import os
+import re
+import sys
+from threading import Lock, local
 
 from aracnid_logger import Logger
-from dateutil import tz, utils
+from dateutil import tz
 from dateutil.parser import parse
+from requests import Session
+from requests.adapters import HTTPAdapter
 from square.client import Client
 
+# use the C parser for RFC 3339 timestamps, if it is installed
+try:
+    from ciso8601 import parse_rfc3339
+except ImportError:
+    parse_rfc3339 = None
+
 # initialize logging
 logger = Logger(__name__).get_logger()
 
+# local time zone for datetime strings without a time zone
+LOCAL_TZ = tz.tzlocal()
+
+# maximum number of concurrent requests to Square, and of open connections
+# per thread
+SQUARE_POOL_SIZE = 16
+
+# guards the creation of the resources shared by all interfaces
+shared_lock = Lock()
+
+# whether datetime.fromisoformat() parses the "Z" time zone (Python 3.11+)
+FROMISOFORMAT_Z = sys.version_info >= (3, 11)
+
+# RFC 3339 timestamps, as returned by Square
+RFC3339_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,9}))?'
+    r'(Z|[+-]\d{2}:?\d{2})$')
+
+# timestamp fields of the Square objects
+CATALOG_DATETIME_KEYS = ('updated_at',)
+CURBSIDE_DATETIME_KEYS = ('buyer_arrived_at',)
+FEE_DATETIME_KEYS = ('effective_at',)
+LOCATION_DATETIME_KEYS = ('created_at',)
+ORDER_DATETIME_KEYS = ('created_at', 'updated_at', 'closed_at')
+PAYMENT_DATETIME_KEYS = ('created_at', 'updated_at', 'delayed_until')
+PAYOUT_DATETIME_KEYS = ('created_at', 'updated_at')
+PAYOUT_ENTRY_DATETIME_KEYS = ('effective_at',)
+PICKUP_DATETIME_KEYS = (
+    'accepted_at', 'canceled_at', 'expired_at', 'picked_up_at', 'pickup_at',
+    'placed_at', 'ready_at', 'rejected_at')
+REFUND_DATETIME_KEYS = ('created_at', 'updated_at')
+SHIPMENT_DATETIME_KEYS = (
+    'canceled_at', 'expected_shipped_at', 'failed_at', 'in_progress_at',
+    'packaged_at', 'placed_at', 'shipped_at')
+TENDER_DATETIME_KEYS = ('created_at',)
+
+# decoding schemas of the Square objects, mapping each field to its spec:
+# DATETIME decodes a timestamp, ('dict', schema) decodes a nested object, and
+# ('list', schema) decodes each object of a nested list
+DATETIME = 'datetime'
+CATALOG_SCHEMA = dict.fromkeys(CATALOG_DATETIME_KEYS, DATETIME)
+CATALOG_ITEM_SCHEMA = {
+    **CATALOG_SCHEMA,
+    'item_data': ('dict', {'variations': ('list', CATALOG_SCHEMA)}),
+}
+FEE_SCHEMA = dict.fromkeys(FEE_DATETIME_KEYS, DATETIME)
+LOCATION_SCHEMA = dict.fromkeys(LOCATION_DATETIME_KEYS, DATETIME)
+PAYMENT_SCHEMA = {
+    **dict.fromkeys(PAYMENT_DATETIME_KEYS, DATETIME),
+    'processing_fee': ('list', FEE_SCHEMA),
+}
+PAYOUT_SCHEMA = dict.fromkeys(PAYOUT_DATETIME_KEYS, DATETIME)
+PAYOUT_ENTRY_SCHEMA = dict.fromkeys(PAYOUT_ENTRY_DATETIME_KEYS, DATETIME)
+PICKUP_SCHEMA = {
+    **dict.fromkeys(PICKUP_DATETIME_KEYS, DATETIME),
+    'curbside_pickup_details': (
+        'dict', dict.fromkeys(CURBSIDE_DATETIME_KEYS, DATETIME)),
+}
+SHIPMENT_SCHEMA = dict.fromkeys(SHIPMENT_DATETIME_KEYS, DATETIME)
+FULFILLMENT_SCHEMA = {
+    'pickup_details': ('dict', PICKUP_SCHEMA),
+    'shipment_details': ('dict', SHIPMENT_SCHEMA),
+}
+REFUND_SCHEMA = {
+    **dict.fromkeys(REFUND_DATETIME_KEYS, DATETIME),
+    'processing_fee': ('list', FEE_SCHEMA),
+}
+TENDER_SCHEMA = dict.fromkeys(TENDER_DATETIME_KEYS, DATETIME)
+ORDER_SCHEMA = {
+    **dict.fromkeys(ORDER_DATETIME_KEYS, DATETIME),
+    'fulfillments': ('list', FULFILLMENT_SCHEMA),
+    'tenders': ('list', TENDER_SCHEMA),
+    'refunds': ('list', REFUND_SCHEMA),
+}
+
+
+def _match_rfc3339(dt_str):
+    """Converts an RFC 3339 timestamp string into a datetime object.
+
+    The string is matched by a precompiled pattern and the datetime is built
+    directly from the matched fields.
+
+    Args:
+        dt_str: Datetime string to convert.
+
+    Returns:
+        Datetime object, or None if the string is not an RFC 3339 timestamp.
+    """
+    match = RFC3339_RE.match(dt_str)
+    if not match:
+        return None
+
+    (year, month, day, hour, minute, second,
+     fraction, offset) = match.groups()
+
+    tzinfo = timezone.utc
+    if offset != 'Z':
+        offset_minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+        if offset[0] == '-':
+            offset_minutes = -offset_minutes
+        tzinfo = timezone(timedelta(minutes=offset_minutes))
+
+    microsecond = 0
+    if fraction:
+        microsecond = int(fraction.ljust(6, '0')[:6])
+
+    try:
+        return datetime(
+            int(year), int(month), int(day), int(hour), int(minute),
+            int(second), microsecond, tzinfo=tzinfo)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _decode_datetime(dt_str):
+    """Decodes a Square datetime string into a datetime object.
+
+    The decoded datetimes are cached, because Square objects often share
+    timestamps, e.g., "created_at" and "updated_at". The cache is bounded so
+    that long pulls do not grow it without limit.
+
+    RFC 3339 timestamps, e.g., "YYYY-MM-DDTHH:MM:SS(.fff)Z", are converted by
+    ciso8601 if it is installed, otherwise by datetime.fromisoformat(). The
+    precompiled pattern covers the fractions that fromisoformat() rejects
+    before Python 3.11. Any other form is left to the generic parser.
+
+    Args:
+        dt_str: Datetime string to decode.
+
+    Returns:
+        Datetime object.
+    """
+    # fast path for RFC 3339 timestamps
+    if parse_rfc3339:
+        try:
+            return parse_rfc3339(dt_str)
+        except ValueError:
+            pass
+
+    # fast path for ISO 8601 timestamps
+    iso_str = dt_str
+    if not FROMISOFORMAT_Z and dt_str.endswith('Z'):
+        iso_str = f'{dt_str[:-1]}+00:00'
+    try:
+        dtx = datetime.fromisoformat(iso_str)
+    except ValueError:
+        dtx = _match_rfc3339(dt_str) or parse(dt_str)
+
+    if dtx.tzinfo is None:
+        return dtx.replace(tzinfo=LOCAL_TZ)
+
+    return dtx
+
+
+def _decode_schema(obj, schema):
+    """Decodes the timestamps of a Square object in place, following a schema.
+
+    Fields that are missing, set to None or already decoded are skipped.
+
+    Args:
+        obj: The Square object.
+        schema: Decoding schema of the Square object.
+    """
+    for key, spec in schema.items():
+        value = obj.get(key)
+        if value is None:
+            continue
+
+        if spec is DATETIME:
+            if not isinstance(value, datetime):
+                obj[key] = _decode_datetime(value)
+        elif spec[0] == 'list':
+            for item in value:
+                _decode_schema(item, spec[1])
+        else:
+            _decode_schema(value, spec[1])
+
+
+class ThreadLocalSession(Session):
+    """Requests session with separate transport adapters in each thread.
+
+    The Square SDK sets the retry settings of the adapters of its session for
+    every request, so adapters shared by concurrent requests would race. Each
+    thread gets its own adapters, copied from the adapters of the session
+    created by the SDK, with connection pools of SQUARE_POOL_SIZE. The
+    requests are made by long-lived threads, mostly those of the shared
+    request pool of SquareInterface, so the connections are kept alive and
+    reused.
+
+    Attributes:
+        base_adapters: Transport adapters copied by each thread.
+    """
+
+    def __init__(self, base_session):
+        """Initializes the session from the session created by the SDK.
+
+        Args:
+            base_session: Requests session created by the Square SDK.
+        """
+        self._local = local()
+        super().__init__()
+        self.verify = base_session.verify
+        self.base_adapters = OrderedDict(base_session.adapters)
+
+        # drop the default adapters mounted by the constructor
+        self._local = local()
+
+    @property
+    def adapters(self):
+        """Returns the transport adapters of the current thread.
+
+        Returns:
+            Ordered dictionary of the transport adapters by URL prefix.
+        """
+        adapters = getattr(self._local, 'adapters', None)
+        if adapters is None:
+            adapters = self._local.adapters = OrderedDict(
+                (prefix, HTTPAdapter(
+                    pool_maxsize=SQUARE_POOL_SIZE,
+                    max_retries=deepcopy(adapter.max_retries)))
+                for prefix, adapter in self.base_adapters.items())
+
+        return adapters
+
+    @adapters.setter
+    def adapters(self, adapters):
+        """Sets the transport adapters of the current thread.
+
+        Args:
+            adapters: Ordered dictionary of the transport adapters by URL
+                prefix.
+        """
+        self._local.adapters = adapters
+
 
 class SquareInterface:
     """Interface to Square.
@@ -22,21 +274,23 @@ class SquareInterface:
         api_orders: Square client to the Orders API.
         api_payments: Square client to the Payments API.
         api_refunds: Square client to the Refunds API.
+        search_methods: Square search method for each type of Square object.
         square_client: The Square Client.
     """
 
+    # Square client, shared by all interfaces
+    _square_client = None
+
+    # thread pool for concurrent Square API requests, shared by all interfaces
+    _request_pool = None
+
     def __init__(self):
         """Initializes the Square interface.
 
         Args:
             square_client: The Square Client.
         """
-        square_access_token = os.environ.get('SQUARE_ACCESS_TOKEN')
-        square_environment = os.environ.get('SQUARE_ENV')
-        self.square_client = Client(
-            access_token=square_access_token,
-            environment=square_environment
-        )
+        self.square_client = self.get_square_client()
 
         self.api_orders = self.square_client.orders
         self.api_payments = self.square_client.payments
@@ -45,23 +299,89 @@ class SquareInterface:
         self.api_locations = self.square_client.locations
         self.api_payouts = self.square_client.payouts
 
+        # search method for each type of Square object
+        self.search_methods = {
+            'orders': self.api_orders.search_orders,
+            'objects': self.api_catalog.search_catalog_objects,
+        }
+
     # region METHODS
 
+    @staticmethod
+    def get_square_client():
+        """Returns the Square client.
+
+        The client is only created the first time it is requested in this
+        process, so every interface reuses it, even when the interfaces are
+        created by concurrent threads. Its HTTP session keeps separate
+        adapters in each thread, which reuse their open connections, since the
+        SDK changes the adapter retry settings for every request.
+
+        Returns:
+            The Square Client.
+        """
+        with shared_lock:
+            if SquareInterface._square_client is None:
+                square_client = Client(
+                    access_token=os.environ.get('SQUARE_ACCESS_TOKEN'),
+                    environment=os.environ.get('SQUARE_ENV')
+                )
+
+                # give each thread its own adapters, keeping the retry settings
+                http_client = square_client.config.http_client
+                http_client.session = ThreadLocalSession(http_client.session)
+
+                SquareInterface._square_client = square_client
+
+        return SquareInterface._square_client
+
+    @staticmethod
+    def get_request_pool():
+        """Returns the thread pool for concurrent Square API requests.
+
+        The pool is only created the first time it is requested in this
+        process. Its threads are kept, so the connections of their session
+        adapters are reused by the following requests.
+
+        Returns:
+            The thread pool for Square API requests.
+        """
+        with shared_lock:
+            if SquareInterface._request_pool is None:
+                SquareInterface._request_pool = ThreadPoolExecutor(
+                    max_workers=SQUARE_POOL_SIZE)
+
+        return SquareInterface._request_pool
+
     @staticmethod
     def decode_datetime(dt_str):
         """Decodes a Square datetime string into a datetime object
 
-        The datetime.fromisoformat() class method does not handle "Z" timezone
-        notation, so the default_tzinfo() method is used instead.
+        The parsers are tried in order: ciso8601, if it is installed, for RFC
+        3339 strings, then datetime.fromisoformat(), with a "Z" time zone
+        rewritten before Python 3.11, then the RFC 3339 pattern, for the
+        fractions that fromisoformat() rejects, and finally dateutil for any
+        other form. Datetime strings without a time zone are set to the local
+        time zone. Datetime objects, such as those read from MongoDB, are
+        returned unchanged.
 
         Args:
             dt_str: Datetime string to decode.
+
+        Returns:
+            Datetime object.
         """
-        return utils.default_tzinfo(parse(dt_str), tz.tzlocal())
+        if isinstance(dt_str, datetime):
+            return dt_str
+
+        return _decode_datetime(dt_str)
 
     def search(self, obj_type, search_filter):
         """Retrieves a list of filtered Square objects.
 
+        The pages are collected as they are retrieved and joined once at the
+        end, instead of extending a single list page by page.
+
         Args:
             obj_type: Type of Square object to search, e.g., 'orders', 'items', etc.
             search_filter: Search filter
@@ -69,43 +389,82 @@ class SquareInterface:
         Returns:
             List of Square objects that meet the filter criteria.
         """
-        obj_list = []
-
-        # get the api for the object
-        api_type = None
-        if obj_type == 'orders':
-            api_type = self.api_orders
-        elif obj_type == 'objects':
-            api_type = self.api_catalog
-
-        if not api_type:
-            return obj_list
-
-        loop_count = 0
-        result = self.search_fn(obj_type, search_filter)
-        if result.is_success():
-            loop_count += 1
-            obj_list = result.body.get(obj_type)
-
-            # process remaining pages
-            cursor = result.body['cursor'] if 'cursor' in result.body else None
-            while cursor:
-                search_filter['cursor'] = cursor
-                result = self.search_fn(obj_type, search_filter)
-
-                if result.is_success():
-                    loop_count += 1
-                    obj_list.extend(result.body[obj_type])
-                    cursor = result.body['cursor'] if 'cursor' in result.body else None
-                elif result.is_error():
-                    logger.error(f'Error calling Square Api ({obj_type}): {loop_count}')
-                    logger.error(result.errors)
-
-        elif result.is_error():
-            logger.error(f'Error calling Square Api ({obj_type}): loop {loop_count}')
-            logger.error(result.errors)
-
-        return obj_list
+        return list(chain.from_iterable(
+            self.search_pages(obj_type, search_filter)))
+
+    def search_pages(self, obj_type, search_filter):
+        """Retrieves pages of filtered Square objects.
+
+        The next page is requested in the background, by the shared request
+        pool, while the caller processes the current page, so the Square
+        round-trips are not spent waiting on the caller.
+
+        Args:
+            obj_type: Type of Square object to search, e.g., 'orders', 'items', etc.
+            search_filter: Search filter
+
+        Yields:
+            List of Square objects for each page that meets the filter criteria.
+        """
+        executor = self.get_request_pool()
+        page_count = 0
+        future = executor.submit(self.search_fn, obj_type, search_filter)
+        while future:
+            result = future.result()
+            future = None
+
+            if not result:
+                return
+
+            if result.is_error():
+                logger.error(f'Error calling Square Api ({obj_type}): page {page_count}')
+                logger.error(result.errors)
+                return
+
+            # request the next page before handing over this one
+            page_count += 1
+            cursor = result.body.get('cursor')
+            if cursor:
+                future = executor.submit(
+                    self.search_fn, obj_type, {**search_filter, 'cursor': cursor})
+
+            yield result.body.get(obj_type, [])
+
+    @staticmethod
+    def list_pages(list_fn, obj_type, **kwargs):
+        """Retrieves pages of Square objects from a list endpoint.
+
+        Like search_pages(), the next page is requested in the background while
+        the caller processes the current page.
+
+        Args:
+            list_fn: Square API list method, e.g., api_payouts.list_payouts.
+            obj_type: Type of Square object listed, e.g., 'payouts'.
+            **kwargs: Keyword arguments of the list method.
+
+        Yields:
+            List of Square objects for each page.
+        """
+        executor = SquareInterface.get_request_pool()
+        future = executor.submit(list_fn, **kwargs)
+        while future:
+            result = future.result()
+            future = None
+
+            if result.is_error():
+                for error in result.errors:
+                    logger.error(
+                        'error reading %s: %s, %s\n%s', obj_type,
+                        error['category'], error['code'], error['detail']
+                    )
+                return
+
+            # request the next page before handing over this one
+            cursor = result.cursor
+            if cursor:
+                future = executor.submit(list_fn, **kwargs, cursor=cursor)
+
+            yield result.body.get(obj_type, [])
 
     def search_fn(self, obj_type, search_filter):
         """Executes the search function for the specified "obj_type".
@@ -117,12 +476,11 @@ class SquareInterface:
         Returns:
             Result of the search function.
         """
-        if obj_type == 'orders':
-            return self.api_orders.search_orders(search_filter)
-        if obj_type == 'objects':
-            return self.api_catalog.search_catalog_objects(search_filter)
+        search_method = self.search_methods.get(obj_type)
+        if not search_method:
+            return None
 
-        return None
+        return search_method(search_filter)
 
     # endregion
 
@@ -140,15 +498,10 @@ class SquareInterface:
                 'square_categories', 'square_items', 'square_variations',
                 'square_modifiers'
         """
-        if 'updated_at' in obj:
-            obj['updated_at'] = self.decode_datetime(
-                obj['updated_at'])
-
         if collection == 'square_items':
-            variations = obj['item_data']['variations']
-            for variation in variations:
-                variation['updated_at'] = self.decode_datetime(
-                    variation['updated_at'])
+            _decode_schema(obj, CATALOG_ITEM_SCHEMA)
+        else:
+            _decode_schema(obj, CATALOG_SCHEMA)
 
     def decode_fulfillment(self, fulfillment):
         """Decodes a Square OrderFulfillment into a python dictionary.
@@ -159,13 +512,7 @@ class SquareInterface:
         Args:
             fulfillment: The Square OrderFulfillment object.
         """
-        if 'pickup_details' in fulfillment:
-            pickup_details = fulfillment['pickup_details']
-            self.decode_fulfillment_pickup(pickup_details)
-
-        if 'shipment_details' in fulfillment:
-            shipment_details = fulfillment['shipment_details']
-            self.decode_fulfillment_shipment(shipment_details)
+        _decode_schema(fulfillment, FULFILLMENT_SCHEMA)
 
     def decode_fulfillment_pickup(self, pickup_details):
         """Decodes a Square OrderFulfillment pickup details.
@@ -176,34 +523,7 @@ class SquareInterface:
         Args:
             pickup_details: The Square OrderFulfillment pickup details.
         """
-        if 'accepted_at' in pickup_details:
-            pickup_details['accepted_at'] = self.decode_datetime(
-                pickup_details['accepted_at'])
-        if 'canceled_at' in pickup_details:
-            pickup_details['canceled_at'] = self.decode_datetime(
-                pickup_details['canceled_at'])
-        if 'curbside_pickup_details' in pickup_details:
-            curbside_pickup_details = pickup_details['curbside_pickup_details']
-            curbside_pickup_details['buyer_arrived_at'] = self.decode_datetime(
-                curbside_pickup_details['buyer_arrived_at'])
-        if 'expired_at' in pickup_details:
-            pickup_details['expired_at'] = self.decode_datetime(
-                pickup_details['expired_at'])
-        if 'picked_up_at' in pickup_details:
-            pickup_details['picked_up_at'] = self.decode_datetime(
-                pickup_details['picked_up_at'])
-        if 'pickup_at' in pickup_details:
-            pickup_details['pickup_at'] = self.decode_datetime(
-                pickup_details['pickup_at'])
-        if 'placed_at' in pickup_details:
-            pickup_details['placed_at'] = self.decode_datetime(
-                pickup_details['placed_at'])
-        if 'ready_at' in pickup_details:
-            pickup_details['ready_at'] = self.decode_datetime(
-                pickup_details['ready_at'])
-        if 'rejected_at' in pickup_details:
-            pickup_details['rejected_at'] = self.decode_datetime(
-                pickup_details['rejected_at'])
+        _decode_schema(pickup_details, PICKUP_SCHEMA)
 
     def decode_fulfillment_shipment(self, shipment_details):
         """Decodes a Square OrderFulfillment shipment details.
@@ -214,27 +534,7 @@ class SquareInterface:
         Args:
             shipment_details: The Square OrderFulfillment shipment details.
         """
-        if 'canceled_at' in shipment_details:
-            shipment_details['canceled_at'] = self.decode_datetime(
-                shipment_details['canceled_at'])
-        if 'expected_shipped_at' in shipment_details:
-            shipment_details['expected_shipped_at'] = self.decode_datetime(
-                shipment_details['expected_shipped_at'])
-        if 'failed_at' in shipment_details:
-            shipment_details['failed_at'] = self.decode_datetime(
-                shipment_details['failed_at'])
-        if 'in_progress_at' in shipment_details:
-            shipment_details['in_progress_at'] = self.decode_datetime(
-                shipment_details['in_progress_at'])
-        if 'packaged_at' in shipment_details:
-            shipment_details['packaged_at'] = self.decode_datetime(
-                shipment_details['packaged_at'])
-        if 'placed_at' in shipment_details:
-            shipment_details['placed_at'] = self.decode_datetime(
-                shipment_details['placed_at'])
-        if 'shipped_at' in shipment_details:
-            shipment_details['shipped_at'] = self.decode_datetime(
-                shipment_details['shipped_at'])
+        _decode_schema(shipment_details, SHIPMENT_SCHEMA)
 
     def decode_location(self, location):
         """Decodes a Square Location into a python dictionary.
@@ -245,9 +545,7 @@ class SquareInterface:
         Args:
             location: The Square Location object.
         """
-        if 'created_at' in location:
-            location['created_at'] = self.decode_datetime(
-                location['created_at'])
+        _decode_schema(location, LOCATION_SCHEMA)
 
     def decode_order(self, order):
         """Decodes a Square Order into a python dictionary.
@@ -258,24 +556,7 @@ class SquareInterface:
         Args:
             order: The Square Order object.
         """
-        if 'created_at' in order:
-            order['created_at'] = self.decode_datetime(
-                order['created_at'])
-        if 'updated_at' in order:
-            order['updated_at'] = self.decode_datetime(
-                order['updated_at'])
-        if 'closed_at' in order:
-            order['closed_at'] = self.decode_datetime(
-                order['closed_at'])
-        if 'fulfillments' in order:
-            for fulfillment in order['fulfillments']:
-                self.decode_fulfillment(fulfillment)
-        if 'tenders' in order:
-            for tender in order['tenders']:
-                self.decode_tender(tender)
-        if 'refunds' in order:
-            for refund in order['refunds']:
-                self.decode_refund(refund)
+        _decode_schema(order, ORDER_SCHEMA)
 
     def decode_payment(self, payment):
         """Decodes a Square Payment into a python dictionary.
@@ -286,20 +567,7 @@ class SquareInterface:
         Args:
             payment: The Square Payment object.
         """
-        if 'created_at' in payment:
-            payment['created_at'] = self.decode_datetime(
-                payment['created_at'])
-        if 'updated_at' in payment:
-            payment['updated_at'] = self.decode_datetime(
-                payment['updated_at'])
-        if 'processing_fee' in payment:
-            for fee in payment['processing_fee']:
-                if 'effective_at' in fee:
-                    fee['effective_at'] = self.decode_datetime(
-                        fee['effective_at'])
-        if 'delayed_until' in payment:
-            payment['delayed_until'] = self.decode_datetime(
-                payment['delayed_until'])
+        _decode_schema(payment, PAYMENT_SCHEMA)
 
     def decode_payout(self, payout):
         """Decodes a Square Payout into a python dictionary.
@@ -310,10 +578,7 @@ class SquareInterface:
         Args:
             payout: The Square payout object.
         """
-        if 'created_at' in payout:
-            payout['created_at'] = self.decode_datetime(payout['created_at'])
-        if 'updated_at' in payout:
-            payout['updated_at'] = self.decode_datetime(payout['updated_at'])
+        _decode_schema(payout, PAYOUT_SCHEMA)
 
     def decode_payout_entry(self, payout_entry):
         """Decodes a Square Payout into a python dictionary.
@@ -324,10 +589,7 @@ class SquareInterface:
         Args:
             payout_entry: The Square payout_entry object.
         """
-        if 'effective_at' in payout_entry:
-            payout_entry['effective_at'] = self.decode_datetime(
-                payout_entry['effective_at']
-            )
+        _decode_schema(payout_entry, PAYOUT_ENTRY_SCHEMA)
 
     def decode_refund(self, refund):
         """Decodes a Square PaymentRefund into a python dictionary.
@@ -338,17 +600,7 @@ class SquareInterface:
         Args:
             refund: The Square PaymentRefund object.
         """
-        if 'created_at' in refund:
-            refund['created_at'] = self.decode_datetime(
-                refund['created_at'])
-        if 'updated_at' in refund:
-            refund['updated_at'] = self.decode_datetime(
-                refund['updated_at'])
-        if 'processing_fee' in refund:
-            for fee in refund['processing_fee']:
-                if 'effective_at' in fee:
-                    fee['effective_at'] = self.decode_datetime(
-                        fee['effective_at'])
+        _decode_schema(refund, REFUND_SCHEMA)
 
     def decode_tender(self, tender):
         """Decodes a Square Tender into a python dictionary.
@@ -359,8 +611,6 @@ class SquareInterface:
         Args:
             tender: The Square Tender object.
         """
-        if 'created_at' in tender:
-            tender['created_at'] = self.decode_datetime(
-                tender['created_at'])
+        _decode_schema(tender, TENDER_SCHEMA)
 
     # endregion
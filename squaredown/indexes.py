@@ -0,0 +1,58 @@
+"""MongoDB indexes of the Square collections.
+"""
+from pymongo import IndexModel
+
+
+# indexes hinted to the report facet aggregations, which must use the
+# timespan index
+ORDER_INDEX = [('state', 1), ('created_at', 1)]
+ITEMIZATION_INDEX = [('order_state', 1), ('order_created_at', 1)]
+
+# indexes that support the leading matches of the report pipelines, with the
+# equality fields before the timespan field
+INDEXES = {
+    'square_orders': [
+        IndexModel(ORDER_INDEX),
+    ],
+    'square_payments': [
+        IndexModel([('status', 1), ('created_at', 1)]),
+    ],
+    'square_refunds': [
+        IndexModel([('status', 1), ('created_at', 1)]),
+    ],
+    'square_payout_entries': [
+        IndexModel([('type', 1), ('effective_at', 1)]),
+    ],
+    'square_order_itemizations': [
+        IndexModel(ITEMIZATION_INDEX),
+    ],
+    'square_order_tenders': [
+        IndexModel([('order_state', 1), ('created_at', 1)]),
+    ],
+}
+
+# names of the databases indexed by this process
+_indexed_databases = set()
+
+
+def ensure_indexes(mdb):
+    """Creates the MongoDB indexes of the Square collections.
+
+    This is called by the pulls, which write the collections, so reports can
+    be read by MongoDB users without write access. Until it has run on a
+    database, the report facets run without their index hints. The indexes
+    are only created once per database per process. Creating an index that
+    already exists has no effect.
+
+    Args:
+        mdb: MongoDB database with the Square collections.
+
+    Returns:
+        None
+    """
+    if mdb.name in _indexed_databases:
+        return
+
+    for collection_name, indexes in INDEXES.items():
+        mdb.read_collection(collection_name).create_indexes(indexes)
+    _indexed_databases.add(mdb.name)
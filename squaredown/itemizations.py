@@ -1,6 +1,11 @@
 """Itemizations class module for Squaredown.
 """
+import logging
+
 from aracnid_logger import Logger
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+from pymongo import ReplaceOne
 
 from squaredown.connector import Connector
 
@@ -11,6 +16,9 @@ logger = Logger(__name__).get_logger()
 class Itemizations(Connector):
     """Contains the code to process Square Order Itemizations.
 
+    Itemizations are queued for writing, so flush() must be called to save
+    them in MongoDB.
+
     Attributes:
         collection: Square Order Itemizations collection in MongoDB.
         collection_name: Name of the Itemizations collection in MongoDB.
@@ -24,40 +32,43 @@ class Itemizations(Connector):
 
         """
         self.collection_name = 'square_order_itemizations'
-        logger.debug(f'collection_name: {self.collection_name}')
+        logger.debug('collection_name: %s', self.collection_name)
         super().__init__(config_name=self.collection_name)
 
         # initialize MongoDB collection
         self.collection = self.mdb.read_collection(self.collection_name)
 
-    def save_raw_itemization(self, itemization, order):
-        """Save the provided raw Square Object into MongoDB.
+    def save_raw_itemization(self, itemization, order, obj_id=None):
+        """Queues the provided raw Square Object to be saved in MongoDB.
 
         The object identifier, obj_id, is the concatenation of the order
         id and the uid of the line item. The uid of the line item is not
         guaranteed to be unique across all orders.
 
+        The itemization is encoded right away, so the queued write keeps the
+        raw itemization even though it is processed in place before the
+        flush. The write is only sent to MongoDB by flush().
+
         Args:
             itemization: Raw Square Itemization object
             order: Square Order object.
+            obj_id: Object identifier, if already made by the caller.
 
         Returns:
             The MongoDB representation of the raw Square Itemization object.
         """
         # get object properties
-        order_id = order['_id']
-        itemization_id = itemization['uid']
-        obj_id = f'{order_id}_{itemization_id}'
+        if obj_id is None:
+            obj_id = f'{order["_id"]}_{itemization["uid"]}'
 
         # log the update
         # logger.debug(f'{obj_id}')
 
-        # update the database
-        self.mdb.raw_square_order_itemizations.find_one_and_replace(
-            filter={'_id': obj_id},
-            replacement=itemization,
-            upsert=True
-        )
+        # queue the update with the encoded raw itemization
+        self.queue_op(
+            'raw_square_order_itemizations',
+            ReplaceOne({'_id': obj_id}, RawBSONDocument(encode(itemization)),
+                       upsert=True))
 
         return itemization
 
@@ -68,18 +79,20 @@ class Itemizations(Connector):
         id and the uid of the line item. The uid of the line item is not
         guaranteed to be unique across all orders.
 
+        The raw and processed itemizations are queued, so they are only saved
+        in MongoDB by flush().
+
         Args:
             itemization: Square Itemization object.
             order: Square Order object.
             props: Additional properties to set.
         """
+        # make the itemization identifier
+        itemization_id = f'{order["_id"]}_{itemization["uid"]}'
+
         # save the raw itemization
-        self.save_raw_itemization(itemization, order)
+        self.save_raw_itemization(itemization, order, obj_id=itemization_id)
 
-        # make the itemization identifier
-        order_id = order['_id']
-        uid = itemization['uid']
-        itemization_id = f'{order_id}_{uid}'
         itemization['id'] = itemization_id
 
         # add additional properties
@@ -88,15 +101,10 @@ class Itemizations(Connector):
         # apply itemization customizations
         self.apply_itemization_customizations(itemization, order)
 
-        # remove previous itemizations saved under uid
-        self.collection.delete_one(
-            filter={'_id': itemization['uid']})
-
         # save/replace itemization
-        self.collection.find_one_and_replace(
-            filter={'_id': itemization_id},
-            replacement=itemization,
-            upsert=True)
+        self.queue_op(
+            self.collection_name,
+            ReplaceOne({'_id': itemization_id}, itemization, upsert=True))
 
     def apply_itemization_customizations(self, itemization, order):
         """Apply customizations to the Square Order Itemization object.
@@ -111,13 +119,30 @@ class Itemizations(Connector):
         Returns:
             None.
         """
-        logger.debug(f'Applying default customizations: {self.collection_name}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Applying default customizations: %s', self.collection_name)
 
-        # set the "source" property, default to PoS
-        source = 'Point of Sale'
-        if 'source' in order:
-            source = order['source'].get('name', 'Point of Sale')
-        itemization['order_source'] = source
+        # set the "source" property, unless set from the order properties
+        if 'order_source' not in itemization:
+            itemization['order_source'] = self.get_order_source(order)
 
         # convert the quantity property to integer
-        itemization['quantity'] = int(itemization['quantity'])
+        quantity = itemization['quantity']
+        if not isinstance(quantity, int):
+            itemization['quantity'] = int(quantity)
+
+    @staticmethod
+    def get_order_source(order):
+        """Returns the name of the source of the Square Order.
+
+        Args:
+            order: Square Order object
+
+        Returns:
+            Name of the order source, defaults to "Point of Sale".
+        """
+        source = order.get('source')
+        if source is None:
+            return 'Point of Sale'
+
+        return source.get('name', 'Point of Sale')
@@ -1,6 +1,7 @@
 """Locations class module for Squaredown.
 """
 from aracnid_logger import Logger
+from pymongo import ReplaceOne
 
 from squaredown.connector import Connector
 
@@ -27,7 +28,7 @@ class Locations(Connector):
 
         """
         self.collection_name = 'square_locations'
-        logger.debug(f'collection_name: {self.collection_name}')
+        logger.debug('collection_name: %s', self.collection_name)
         super().__init__(config_name=self.collection_name)
 
         # initialize MongoDB collection
@@ -52,33 +53,35 @@ class Locations(Connector):
         elif result.is_error():
             logger.error(result.errors)
 
-        update_count = 0
-        if locations:
-            for location in locations:
-                self.update_location(location)
-                update_count += 1
+        # save the locations in a single bulk write
+        ops = [self.make_location_op(location) for location in locations or []]
+        update_count = len(ops)
+        self.flush_batch(self.collection, ops)
 
-        logger.debug(f'locations processed: {update_count}')
+        logger.debug('locations processed: %s', update_count)
 
-    def update_location(self, location):
-        """Save the provided Square Location into MongoDB.
+    def make_location_op(self, location):
+        """Makes the MongoDB write operation that saves a Square Location.
 
         Args:
             location: Square Location object
 
         Returns:
-            The MongoDB representation of the Square Location object.
+            MongoDB write operation that upserts the Square Location object.
         """
         self.decode_location(location)
 
-        # get the location properties
-        location_id = location['id']
+        return ReplaceOne({'_id': location['id']}, location, upsert=True)
+
+    def update_location(self, location):
+        """Save the provided Square Location into MongoDB.
+
+        Args:
+            location: Square Location object
 
-        # update the database
-        self.mdb.square_locations.find_one_and_replace(
-            filter={'_id': location_id},
-            replacement=location,
-            upsert=True
-        )
+        Returns:
+            The MongoDB representation of the Square Location object.
+        """
+        self.collection.bulk_write([self.make_location_op(location)])
 
         return location
@@ -1,17 +1,45 @@
 """Orders class module for Squaredown.
 """
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timezone
-import os
+from itertools import chain
+import logging
 
 from aracnid_logger import Logger
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+from pymongo import ReplaceOne
 from tqdm import tqdm
 
-from squaredown.connector import Connector
+from squaredown.connector import BATCH_SIZE, Connector
+from squaredown.indexes import ensure_indexes
 from squaredown.itemizations import Itemizations
 
 # initialize logging
 logger = Logger(__name__).get_logger()
 
+# MongoDB error code of a duplicate key error
+DUPLICATE_KEY_ERROR = 11000
+
+# order state of each Square Tender card status, captured tenders keep the
+# order state
+TENDER_STATES = {
+    'CAPTURED': '',
+    'AUTHORIZED': 'OPEN_TENDER_AUTHORIZED',
+    'VOIDED': 'OPEN_TENDER_VOIDED',
+    'FAILED': 'OPEN_TENDER_FAILED',
+}
+
+# Square Tender types without card details, which end the tender check
+UNCARDED_TENDER_TYPES = frozenset(('WALLET', 'BUY_NOW_PAY_LATER'))
+
+# sort order of the Square Orders search, oldest update first
+ORDER_SORT = {
+    'sort_field': 'UPDATED_AT',
+    'sort_order': 'ASC'
+}
+
 
 class Orders(Connector):
     """Contains the code to connect and pull orders from Square to MongoDB.
@@ -22,6 +50,8 @@ class Orders(Connector):
     Attributes:
         collection: Square Orders collection in MongoDB.
         collection_name: Name of the Square Orders collection in MongoDB.
+        http_pool: Thread pool for concurrent Square API requests, shared by
+            all Square interfaces.
         location_ids: Square location identifiers.
     """
 
@@ -34,68 +64,205 @@ class Orders(Connector):
         """
         self.collection_name = 'square_orders'
         self.collection_name_raw = 'raw_square_orders'
-        logger.debug(f'collection_name: {self.collection_name}')
+        logger.debug('collection_name: %s', self.collection_name)
         super().__init__(config_name=self.collection_name)
 
         # initialize MongoDB collection
         self.collection = self.mdb.read_collection(self.collection_name)
         self.collection_raw = self.mdb.read_collection(self.collection_name_raw)
-        self.location_ids = os.environ.get('SQUARE_LOCATIONS').split(',')
+        self.location_ids = self.get_location_ids()
 
         # initialize reference to Itemizations
         self.itemizations = Itemizations()
 
-    def pull(self, save_last=True, from_raw=False, **kwargs):
+        # initialize the thread pool for Square API requests
+        self.http_pool = self.get_request_pool()
+
+    def pull(self, save_last=True, from_raw=False, max_workers=8, **kwargs):
         """Retrieves/processes a set of Square Orders and saves them in MongoDB.
 
+        The orders are processed concurrently, since each order writes its own
+        MongoDB documents and most of the time is spent waiting on Square and
+        MongoDB. The results are collected in order, so the configuration
+        properties only advance past orders that have been saved.
+
+        The related objects of the orders are queued and written in bulk every
+        BATCH_SIZE orders, together with the configuration properties. If an
+        order fails, the orders completed before it are still saved.
+
+        An order updated during the pull can be returned again. The orders in
+        flight are saved before its newer version is processed, so the newer
+        version is always written last.
+
         Args:
             save_last (bool): if set to True (default), details of the last
                 object retrieved is saved in the configuration properties
             from_raw (bool): if set to True, reprocesses orders previously saved
                 to raw MongoDB collection (default=False)
+            max_workers: Maximum number of orders processed at the same time.
             **kwargs: keyword arguments that specify the timespan to retrieve
 
         Returns:
             None
         """
-        # read the orders
-        orders = self.read_orders(from_raw, **kwargs)
-
-        # end if no orders
-        if not orders or len(orders) == 0:
-            logger.info(f'orders processed: 0')
-            return
+        # create the indexes of the collections written
+        ensure_indexes(self.mdb)
 
-        # check last updated object for duplicate
-        order = orders[0]
-        if order['id'] == self.props.last_id:
-            if self.decode_datetime(order['updated_at']) == self.props.last_updated:
-                orders.pop(0)
+        # read the orders, page by page, skipping duplicates
+        orders = self.skip_duplicates(self.iter_orders(from_raw, **kwargs))
 
         update_count = 0
-        for order in tqdm(orders, desc='orders'):
-            # save the raw order
-            if not from_raw:
-                self.save_raw_order(order)
-
-            # update order
-            self.update_order(order)
-            update_count += 1
-            updated_at = order['updated_at']
-            if isinstance(updated_at, str):
-                updated_at = self.decode_datetime(order['updated_at'])
-
-            # update config properties
-            if save_last:
-                self.props.last_updated = updated_at
-                self.props.last_id = order['id']
-                self.props.update()
-
-            # debug, only process one order
-            # break
+        processed = None
+        futures = deque()
+        order_ids = set()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for order in tqdm(orders, desc='orders', disable=None):
+                    # save the earlier versions of a repeated order first
+                    if order['id'] in order_ids:
+                        while futures:
+                            processed = futures.popleft().result()
+                            update_count += 1
+                        if processed is not None:
+                            checkpoint, processed = processed, None
+                            self.save_processed(checkpoint, save_last)
+                    order_ids.add(order['id'])
+
+                    futures.append(
+                        executor.submit(self.process_order, order, from_raw))
+
+                    # limit the number of orders in flight
+                    if len(futures) >= max_workers * 4:
+                        processed = futures.popleft().result()
+                        update_count += 1
+                        if update_count % BATCH_SIZE == 0:
+                            checkpoint, processed = processed, None
+                            self.save_processed(checkpoint, save_last)
+
+                    # debug, only process one order
+                    # break
+
+                # save the remaining orders
+                while futures:
+                    processed = futures.popleft().result()
+                    update_count += 1
+
+        finally:
+            # save the orders processed since the last checkpoint, even if a
+            # later order failed
+            if processed is not None:
+                self.save_processed(processed, save_last)
 
         logger.info(f'orders processed: {update_count}')
 
+    def skip_duplicates(self, orders):
+        """Yields the Square Orders that have not already been processed.
+
+        An order is a duplicate if it is the last order saved in the
+        configuration properties, or if the same or a newer version of the
+        order was already yielded by this pull, which happens when pages
+        overlap.
+
+        Args:
+            orders: Iterator of Square Orders.
+
+        Yields:
+            Square Orders that are not duplicates.
+        """
+        last_id = self.props.props.get('last_id')
+        last_updated = self.props.props.get('last_updated')
+
+        newest = {}
+        for order in orders:
+            order_id = order['id']
+            updated_at = self.decode_datetime(order['updated_at'])
+
+            # skip the same or an older version of an order
+            newest_updated_at = newest.get(order_id)
+            if newest_updated_at is not None and updated_at <= newest_updated_at:
+                continue
+            newest[order_id] = updated_at
+
+            # skip the last order saved
+            if order_id == last_id and updated_at == last_updated:
+                continue
+
+            yield order
+
+    def process_order(self, order, from_raw=False):
+        """Saves the provided Square Order and its related objects in MongoDB.
+
+        The writes are queued, so they are only sent to MongoDB by flush().
+
+        Args:
+            order: Square Order object.
+            from_raw (bool): if set to True, the order was read from the raw
+                MongoDB collection and is not saved there again
+
+        Returns:
+            The MongoDB representation of the Square Order object.
+        """
+        # save the raw order
+        if not from_raw:
+            self.save_raw_order(order)
+
+        # update order
+        return self.update_order(order)
+
+    def flush(self):
+        """Writes the queued MongoDB write operations, including itemizations.
+
+        Returns:
+            None
+        """
+        super().flush()
+        self.itemizations.flush()
+
+    def handle_write_errors(self, collection_name, write_errors):
+        """Handles the errors of the queued writes of a collection.
+
+        FIXED orders do not match the replacement filter, so the upsert tries
+        to insert a duplicate key. These errors are expected and are only
+        logged as warnings.
+
+        Args:
+            collection_name: Name of the MongoDB collection written.
+            write_errors: List of write errors reported by MongoDB.
+
+        Returns:
+            List of the write errors that were not handled.
+        """
+        unhandled = []
+        for error in write_errors:
+            if (collection_name == self.collection_name
+                    and error.get('code') == DUPLICATE_KEY_ERROR):
+                order_id = error['op']['q']['_id']
+                logger.warning(f'Attempted to update FIXED Order "{order_id}"')
+            else:
+                unhandled.append(error)
+
+        return super().handle_write_errors(collection_name, unhandled)
+
+    def save_processed(self, order, save_last):
+        """Saves the queued writes and records the order as the last one.
+
+        Args:
+            order: Processed Square Order object.
+            save_last (bool): if set to True, details of the order are saved in
+                the configuration properties
+
+        Returns:
+            None
+        """
+        updated_at = self.decode_datetime(order['updated_at'])
+
+        # save the queued writes before the config properties
+        self.flush()
+
+        # update config properties
+        if save_last:
+            self.save_props(last_updated=updated_at, last_id=order['id'])
+
     def read_orders(self, from_raw=False, **kwargs):
         """Returns a set of Square Orders.
 
@@ -107,8 +274,26 @@ class Orders(Connector):
         Returns:
             List of Square Orders.
         """
+        return list(self.iter_orders(from_raw, **kwargs))
+
+    def iter_orders(self, from_raw=False, **kwargs):
+        """Returns an iterator over a set of Square Orders.
+
+        Square Orders are retrieved page by page, and the next page is
+        requested while the orders of the current page are processed. Raw
+        orders are read from MongoDB in batches of BATCH_SIZE, so only the
+        current pages are held in memory.
+
+        Args:
+            from_raw (bool): if set to True, reprocesses orders previously saved
+                to raw MongoDB collection (default=False)
+            **kwargs: keyword arguments that specify the timespan to retrieve
+
+        Returns:
+            Iterator of Square Orders.
+        """
         start, end = self.timespan(collection='square_orders', **kwargs)
-        logger.debug(f'timespan: {start}, {end}')
+        logger.debug('timespan: %s, %s', start, end)
 
         if from_raw:
             mongodb_filter = {
@@ -117,38 +302,53 @@ class Orders(Connector):
                     '$lt': end.astimezone(timezone.utc).isoformat()
                 }
             }
-            cursor = self.collection_raw.find(
+            orders = self.collection_raw.find(
                 filter=mongodb_filter,
                 sort=[('updated_at', 1)]
-            )
-
-            orders = list(cursor)
+            ).batch_size(BATCH_SIZE)
 
         else:
-            square_filter = {
-                'location_ids': self.location_ids,
-                'query': {
-                    'filter': {
-                        'date_time_filter': {
-                            'updated_at': {
-                                'start_at': start.isoformat(),
-                                'end_at': end.isoformat()
-                            }
+            square_filter = self.make_square_filter(
+                self.location_ids, start, end)
+
+            orders = chain.from_iterable(
+                self.search_pages('orders', square_filter))
+
+        return iter(orders)
+
+    @staticmethod
+    def make_square_filter(location_ids, start, end):
+        """Returns the Square search filter of the orders updated in a timespan.
+
+        Args:
+            location_ids: Square location identifiers.
+            start: Start of the timespan.
+            end: End of the timespan.
+
+        Returns:
+            Square Orders search filter.
+        """
+        return {
+            'location_ids': location_ids,
+            'query': {
+                'filter': {
+                    'date_time_filter': {
+                        'updated_at': {
+                            'start_at': start.isoformat(),
+                            'end_at': end.isoformat()
                         }
-                    },
-                    'sort': {
-                        'sort_field': 'UPDATED_AT',
-                        'sort_order': 'ASC'
                     }
-                }
+                },
+                'sort': ORDER_SORT
             }
-
-            orders = self.search('orders', square_filter)
-
-        return orders
+        }
 
     def save_raw_order(self, order):
-        """Save the provided raw Square Object into MongoDB.
+        """Queues the provided raw Square Object to be saved in MongoDB.
+
+        The order is encoded right away, so the queued write keeps the raw
+        order even though the order is processed in place before the flush.
+        The write is only sent to MongoDB by flush().
 
         Args:
             order: Raw Square Order object
@@ -160,20 +360,23 @@ class Orders(Connector):
         order_id = order['_id'] = order['id']
 
         # log the update
-        logger.debug(f'{order_id}')
+        logger.debug('%s', order_id)
 
-        # update the database
-        self.collection_raw.find_one_and_replace(
+        # queue the update with the encoded raw order
+        self.queue_op(self.collection_name_raw, ReplaceOne(
             filter={'_id': order_id},
-            replacement=order,
+            replacement=RawBSONDocument(encode(order)),
             upsert=True
-        )
+        ))
 
         return order
 
     def update_order(self, order):
         """Save the provided Square Object into MongoDB.
 
+        The order and its related objects are queued, so they are only saved
+        in MongoDB by flush().
+
         Args:
             order: Square Order object
 
@@ -187,35 +390,35 @@ class Orders(Connector):
         updated_at = order.get('updated_at')
 
         # log the update
-        logger.info(f'update_order {order_id}: '
-                    f'{updated_at.isoformat()[0:16]}')
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('update_order %s: %s',
+                order_id, updated_at.strftime('%Y-%m-%dT%H:%M'))
 
         # get the order state (with overrides)
-        state = self.get_order_state(order)
-        order['state'] = state
+        order['state'] = self.get_order_state(order)
 
         # apply order customizations
         self.apply_order_customizations(order)
 
+        # get the customized state once for the child objects
+        state = self.get_order_state(order)
+
         # process property blocks
-        self.process_tenders(order)
-        self.process_fulfillments(order)
-        self.process_itemizations(order)
+        self.process_tenders(order, state)
+        self.process_fulfillments(order, state)
+        self.process_itemizations(order, state)
         self.process_refunds(order)
-        self.process_returns(order)
-
-        # update the database
-        try:
-            self.collection.find_one_and_replace(
-                filter={
-                    '_id': order_id,
-                    '$or': [{'_fixed': {'$exists': 0}}, {'_fixed': False}]
-                },
-                replacement=order,
-                upsert=True
-            )
-        except self.DuplicateKeyError:
-            logger.warning(f'Attempted to update FIXED Order "{order_id}"')
+        self.process_returns(order, state)
+
+        # update the database, unless the order is FIXED
+        self.queue_op(self.collection_name, ReplaceOne(
+            filter={
+                '_id': order_id,
+                '$or': [{'_fixed': {'$exists': 0}}, {'_fixed': False}]
+            },
+            replacement=order,
+            upsert=True
+        ))
 
         return order
 
@@ -231,7 +434,8 @@ class Orders(Connector):
         Returns:
             None.
         """
-        logger.debug(f'Applying default customizations: {self.collection_name}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Applying default customizations: %s', self.collection_name)
 
         # set the "source" property, default to PoS
         order['source'] = order.get('source', {'name': 'Point of Sale'})
@@ -259,54 +463,61 @@ class Orders(Connector):
         Args:
             order: Square Order object.
         """
-        order_id = order.get('id')
         state = order.get('state')
-        tender_status = None
-
-        if state and state == 'OPEN':
-            tenders = order.get('tenders')
-            if tenders:
-                for tender in tenders:
-                    if tender.get('type') in ('WALLET', 'BUY_NOW_PAY_LATER'):
-                        break
-
-                    if 'card_details' not in tender:
-                        logger.error(
-                            f'Unknown tender type in square order {order_id}'
-                        )
-                        raise Exception('Need to fix tender handling')
-
-                    tender_status = tender['card_details']['status']
-                    if tender_status != 'CAPTURED':
-                        state = f'OPEN_TENDER_{tender_status}'
-                        logger.error(
-                            f'Tender issue ({state}) in square order '
-                            f'{order_id}')
-                        break
+        if state != 'OPEN':
+            return state
 
-            else:
-                state = 'OPEN_TENDER_MISSING'
+        order_id = order.get('id')
+        tenders = order.get('tenders')
+        if not tenders:
+            state = 'OPEN_TENDER_MISSING'
+            logger.error(f'Tender issue ({state}) in square order {order_id}')
+            return state
+
+        for tender in tenders:
+            if tender.get('type') in UNCARDED_TENDER_TYPES:
+                break
+
+            card_details = tender.get('card_details')
+            if card_details is None:
+                logger.error(f'Unknown tender type in square order {order_id}')
+                raise Exception('Need to fix tender handling')
+
+            tender_status = card_details['status']
+            tender_state = TENDER_STATES.get(tender_status)
+            if tender_state is None:
+                tender_state = f'OPEN_TENDER_{tender_status}'
+            if tender_state:
                 logger.error(
-                    f'Tender issue ({state}) in square order {order_id}')
+                    f'Tender issue ({tender_state}) in square order {order_id}')
+                return tender_state
 
         return state
 
-    def process_tenders(self, order):
+    def process_tenders(self, order, state=None):
         """Processes tender data as a separate Square collection.
 
         Args:
             order: Square Order object
+            state: Order state of the tenders, defaults to the current state
+                of the order
         """
         api_payments = self.square_client.payments
 
         tenders = order.get('tenders')
         if tenders:
-            for tender in tenders:
-                tender_id = tender['id']
-                self.update_order_tender(tender, order)
+            # request the corresponding payments concurrently
+            futures = [
+                self.http_pool.submit(
+                    api_payments.get_payment, payment_id=tender['id'])
+                for tender in tenders
+            ]
+
+            for tender, future in zip(tenders, futures):
+                self.update_order_tender(tender, order, state)
 
                 # process corresponding payments
-                result = api_payments.get_payment(payment_id=tender_id)
+                result = future.result()
                 if result.is_success():
                     payment = result.body['payment']
                     self.update_payment(payment)
@@ -326,62 +537,77 @@ class Orders(Connector):
                         logger.error('Error calling PaymentsApi.get_payment')
                         logger.error(result.errors)
 
-    def update_order_tender(self, obj, order):
+    def update_order_tender(self, obj, order, state=None):
         """Updates MongoDB with the provided Square Tender object.
 
+        The write is queued until flush().
+
         Args:
             obj: Square Tender object.
             order: Square Order object.
+            state: Order state of the tender, defaults to the current state of
+                the order.
         """
         collection_name = 'square_order_tenders'
-        self.add_order_properties(obj, order)
-        self.mdb.read_collection(collection_name).find_one_and_replace(
-            {'_id': obj['id']}, obj, upsert=True)
+        self.add_order_properties(obj, order, state)
+        self.queue_op(
+            collection_name, ReplaceOne({'_id': obj['id']}, obj, upsert=True))
 
     def update_payment(self, obj):
         """Updates MongoDB with the provided Square Payment object.
 
+        The write is queued until flush().
+
         Args:
             obj: Square Payment object.
         """
         collection_name = 'square_payments'
         self.decode_payment(obj)
-        self.mdb.read_collection(collection_name).find_one_and_replace(
-            {'_id': obj['id']}, obj, upsert=True)
+        self.queue_op(
+            collection_name, ReplaceOne({'_id': obj['id']}, obj, upsert=True))
 
-    def process_fulfillments(self, order):
+    def process_fulfillments(self, order, state=None):
         """Processes fulfillment data as a separate Square collection.
 
         Args:
             order: Square Order object
+            state: Order state of the fulfillments, defaults to the current
+                state of the order
         """
         if 'fulfillments' in order:
             fulfillments = order['fulfillments']
 
             for fulfillment in fulfillments:
-                self.update_fulfillment(fulfillment, order)
+                self.update_fulfillment(fulfillment, order, state)
 
-    def update_fulfillment(self, obj, order):
+    def update_fulfillment(self, obj, order, state=None):
         """Updates MongoDB with the provided Square Fulfillment object.
 
+        The write is queued until flush().
+
         Args:
             obj: Square Fulfillment object.
             order: Square Order object.
+            state: Order state of the fulfillment, defaults to the current
+                state of the order.
         """
         collection_name = 'square_order_fulfillments'
-        self.add_order_properties(obj, order)
-        self.mdb.read_collection(collection_name).find_one_and_replace(
-            {'_id': obj['uid']}, obj, upsert=True)
+        self.add_order_properties(obj, order, state)
+        self.queue_op(
+            collection_name, ReplaceOne({'_id': obj['uid']}, obj, upsert=True))
 
-    def process_itemizations(self, order):
+    def process_itemizations(self, order, state=None):
         """Processes itemization data as a separate Square collection.
 
         Args:
             order: Square Order object
+            state: Order state of the itemizations, defaults to the current
+                state of the order
         """
         # make additional properties
-        props = self.make_order_properties(order)
+        props = self.make_order_properties(order, state)
         props['itemization_type'] = 'sale'
+        props['order_source'] = self.itemizations.get_order_source(order)
 
         # process each line item
         line_items = order.get('line_items', [])
@@ -398,54 +624,82 @@ class Orders(Connector):
 
         if 'refunds' in order:
             refunds = order['refunds']
-            for refund in refunds:
-                refund_tender_id = refund['tender_id']
-                refund_id = f'{refund_tender_id}_{refund["id"]}'
 
-                result = self.api_refunds.get_payment_refund(
-                    refund_id=refund_id)
+            # request the corresponding payment refunds concurrently
+            futures = [
+                self.http_pool.submit(
+                    self.api_refunds.get_payment_refund,
+                    refund_id=f'{refund["tender_id"]}_{refund["id"]}')
+                for refund in refunds
+            ]
+
+            # save the payment refunds, keeping the refunds without one
+            error_refunds = []
+            for refund, future in zip(refunds, futures):
+                result = future.result()
                 if result.is_success():
-                    refund = result.body['refund']
-                    self.update_refund(refund)
+                    self.update_refund(result.body['refund'])
                 elif result.is_error():
-                    # no payment refund exists, determine reason
-                    tender = self.mdb.square_order_tenders.find_one(
-                        {'_id': refund_tender_id})
-
-                    # cash or other tender refund
-                    if tender and tender['type'] == 'CASH':
-                        logger.debug(f'order: {order_id}, '
-                            'no refund payment for "CASH" tender type')
-                    elif tender and tender['type'] == 'OTHER':
-                        logger.debug(f'order: {order_id}, '
-                            'no refund payment for "OTHER" tender type')
-                    else:
-                        error_detail = result.errors[0]['detail']
-                        logger.error(f'order: {order_id}, {error_detail}')
+                    error_refunds.append((refund, result))
+
+            if not error_refunds:
+                return
+
+            # no payment refund exists, determine reason from the tenders,
+            # which may not have been written yet, only reading their type
+            tenders = {
+                tender['id']: tender for tender in order.get('tenders', [])}
+            tender_ids = list({
+                refund['tender_id'] for refund, _ in error_refunds
+                if refund['tender_id'] not in tenders})
+            if tender_ids:
+                tenders.update(
+                    (tender['_id'], tender)
+                    for tender in self.mdb.square_order_tenders.find(
+                        {'_id': {'$in': tender_ids}}, projection={'type': 1}))
+
+            for refund, result in error_refunds:
+                tender = tenders.get(refund['tender_id'])
+
+                # cash or other tender refund
+                if tender and tender['type'] == 'CASH':
+                    logger.debug('order: %s, '
+                        'no refund payment for "CASH" tender type', order_id)
+                elif tender and tender['type'] == 'OTHER':
+                    logger.debug('order: %s, '
+                        'no refund payment for "OTHER" tender type', order_id)
+                else:
+                    error_detail = result.errors[0]['detail']
+                    logger.error(f'order: {order_id}, {error_detail}')
 
     def update_refund(self, obj):
         """Updates MongoDB with the provided Square Refund object.
 
+        The write is queued until flush().
+
         Args:
             obj: The Square Refund object.
         """
         collection_name = 'square_refunds'
         self.decode_refund(obj)
-        self.mdb.read_collection(collection_name).find_one_and_replace(
-            {'_id': obj['id']}, obj, upsert=True)
+        self.queue_op(
+            collection_name, ReplaceOne({'_id': obj['id']}, obj, upsert=True))
 
-    def process_returns(self, order):
+    def process_returns(self, order, state=None):
         """Processes return data as a separate Square collection.
 
         Args:
             order: Square Order object
+            state: Order state of the return itemizations, defaults to the
+                current state of the order
         """
         # process each return
         returns = order.get('returns', [])
         for return_obj in returns:
             # make additional properties
-            props = self.make_order_properties(order)
+            props = self.make_order_properties(order, state)
             props['itemization_type'] = 'return'
+            props['order_source'] = self.itemizations.get_order_source(order)
             props['source_order_id'] = return_obj['source_order_id']
 
             # process each return line item
@@ -454,27 +708,32 @@ class Orders(Connector):
                 self.itemizations.update_itemization(
                     return_line_item, order, props)
 
-    def add_order_properties(self, obj, order):
+    def add_order_properties(self, obj, order, state=None):
         """Adds additional properties to the object from the Order.
 
         Args:
             obj: Square object to apply order properties.
             order: Square Order object.
+            state: Order state, defaults to the current state of the order.
         """
-        props = self.make_order_properties(order)
+        props = self.make_order_properties(order, state)
         obj.update(props)
 
-    def make_order_properties(self, order):
+    def make_order_properties(self, order, state=None):
         """Make order properties object.
 
         Args:
             order: Square Order object.
+            state: Order state, defaults to the current state of the order.
 
         Return properties object.
         """
+        if state is None:
+            state = self.get_order_state(order)
+
         props = {
             'order_id': order['id'],
-            'order_state': self.get_order_state(order),
+            'order_state': state,
             'order_created_at': order.get('created_at'),
             'order_updated_at': order.get('updated_at'),
             'order_location_id': order.get('location_id')
@@ -2,12 +2,16 @@
 """
 # pylint: disable=no-member
 
-import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
 
 from aracnid_logger import Logger
+from pymongo import ReplaceOne
 from tqdm import tqdm
 
-from squaredown.connector import Connector
+from squaredown.connector import BATCH_SIZE, Connector
+from squaredown.indexes import ensure_indexes
 
 # initialize logging
 logger = Logger(__name__).get_logger()
@@ -38,86 +42,170 @@ class Payouts(Connector):
 
         # initialize MongoDB collection
         self.collection = self.mdb.read_collection(self.collection_name)
-        self.location_ids = os.environ.get('SQUARE_LOCATIONS').split(',')
+        self.location_ids = self.get_location_ids()
 
         # initialize payout entries
         self.payout_entries = PayoutEntries()
 
-    def pull(self, **kwargs):
+    def pull(self, location_id=None, max_workers=8, **kwargs):
         """Retrieves/processes a set of Square Payouts and saves them in MongoDB.
 
-        There is no duplicate checking because the query doesn't return objects
-        based on update time, only start time.
+        The query doesn't return objects based on update time, only start
+        time, so payouts that have not changed since they were saved are
+        skipped. The payouts are saved in bulk writes of BATCH_SIZE payouts.
+
+        The payout entries of several payouts are requested concurrently, and
+        each set of entries is saved as soon as it is received. A payout is
+        only saved after its entries, so a saved payout always has its entries.
 
         Args:
+            location_id: Square location identifier of the payouts, defaults to
+                the main location of the seller.
+            max_workers: Maximum number of payout entry requests at the same
+                time.
             **kwargs: keyword arguments that specify the timespan to retrieve
 
         Returns:
             None
         """
-        # read the payouts
-        payouts = self.read(**kwargs)
+        # create the indexes of the collections written
+        ensure_indexes(self.mdb)
 
-        # end if no payouts
-        if not payouts or len(payouts) == 0:
-            logger.debug('payouts processed: 0')
-            return
+        # read the changed payouts, page by page
+        payouts = self.iter_changed_payouts(location_id, **kwargs)
 
         update_count = 0
-        for payout in tqdm(payouts, desc='payouts'):
-            # update payout
-            self.update_payout(payout)
-            update_count += 1
+        ops = []
+        futures = deque()
 
-            # pull the payout entries
-            self.payout_entries.pull(payout['id'])
+        def save_payout():
+            # save the payout entries before the payout
+            payout, future = futures.popleft()
+            self.payout_entries.save(future.result())
+            ops.append(self.make_payout_op(payout))
+            if len(ops) >= BATCH_SIZE:
+                self.flush_batch(self.collection, ops)
 
-            # debug, only process one payout
-            # break
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for payout in tqdm(payouts, desc='payouts', disable=None):
+                # request the payout entries
+                futures.append((payout, executor.submit(
+                    self.payout_entries.read, payout['id'])))
+                update_count += 1
+
+                # limit the number of requests in flight
+                if len(futures) >= max_workers * 2:
+                    save_payout()
+
+                # debug, only process one payout
+                # break
+
+            # save the remaining payouts
+            while futures:
+                save_payout()
+
+        self.flush_batch(self.collection, ops)
 
         logger.debug('payouts processed: %s', update_count)
 
-    def read(self, **kwargs):
+    @classmethod
+    def pull_many(cls, location_ids=None, max_workers=4, **kwargs):
+        """Pulls the Square Payouts of several locations concurrently.
+
+        The payouts of each location are pulled by their own Payouts Connector
+        in a separate thread. All threads share the same MongoDB and Square
+        clients.
+
+        Args:
+            location_ids: List of Square location identifiers, defaults to the
+                locations in SQUARE_LOCATIONS.
+            max_workers: Maximum number of locations pulled at the same time.
+            **kwargs: keyword arguments passed to pull()
+
+        Returns:
+            None
+        """
+        if location_ids is None:
+            location_ids = cls.get_location_ids()
+
+        def pull_location(location_id):
+            cls().pull(location_id, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(pull_location, location_id)
+                           for location_id in location_ids]:
+                future.result()
+
+    def read(self, location_id=None, **kwargs):
         """Returns a set of Square Payouts.
 
         Args:
+            location_id: Square location identifier of the payouts.
             **kwargs: keyword arguments that specify the timespan to retrieve
 
         Returns:
             List of Square Payouts.
         """
-        payouts = []
+        return list(self.iter_payouts(location_id, **kwargs))
+
+    def iter_payouts(self, location_id=None, **kwargs):
+        """Yields a set of Square Payouts, page by page.
+
+        Args:
+            location_id: Square location identifier of the payouts.
+            **kwargs: keyword arguments that specify the timespan to retrieve
+
+        Yields:
+            Square Payouts.
+        """
+        for page in self.iter_payout_pages(location_id, **kwargs):
+            yield from page
+
+    def iter_changed_payouts(self, location_id=None, **kwargs):
+        """Yields the Square Payouts that changed since they were saved.
+
+        The update times of the saved payouts are read once per page.
+
+        Args:
+            location_id: Square location identifier of the payouts.
+            **kwargs: keyword arguments that specify the timespan to retrieve
+
+        Yields:
+            Square Payouts that are new or have been updated.
+        """
+        for page in self.iter_payout_pages(location_id, **kwargs):
+            saved_updated_at = self.read_updated_at(
+                self.collection, [payout['id'] for payout in page])
+
+            for payout in page:
+                updated_at = saved_updated_at.get(payout['id'])
+                if (updated_at is not None and
+                        updated_at == self.decode_datetime(payout['updated_at'])):
+                    continue
+
+                yield payout
+
+    def iter_payout_pages(self, location_id=None, **kwargs):
+        """Yields pages of Square Payouts.
+
+        Args:
+            location_id: Square location identifier of the payouts, defaults to
+                the main location of the seller.
+            **kwargs: keyword arguments that specify the timespan to retrieve
+
+        Yields:
+            List of Square Payouts for each page.
+        """
         start, end = self.timespan(collection='square_payouts', **kwargs)
         logger.debug('timespan: %s, %s', start, end)
 
-        result = self.api_payouts.list_payouts(
+        # read every page, requesting the next page in the background
+        yield from self.list_pages(
+            self.api_payouts.list_payouts, 'payouts',
+            location_id=location_id,
             begin_time=start.isoformat(),
             end_time=end.isoformat(),
-            sort_order='ASC'
-        )
-
-        if result.is_success():
-            while result.body != {}:
-                payouts.extend(result.body['payouts'])
-
-                if result.cursor:
-                    result = self.api_payouts.list_payouts(
-                        begin_time=start.isoformat(),
-                        end_time=end.isoformat(),
-                        sort_order='ASC',
-                        cursor=result.cursor
-                    )
-                else:
-                    break
-
-        elif result.is_error():
-            for error in result.errors:
-                logger.error(
-                    'error reading payout entries: %s, %s\n%s',
-                    error['category'], error['code'], error['detail']
-                )
-
-        return payouts
+            sort_order='ASC')
 
     def update_payout(self, payout):
         """Save the provided Square Object into MongoDB.
@@ -128,6 +216,22 @@ class Payouts(Connector):
         Returns:
             The MongoDB representation of the Square Payout object.
         """
+        self.collection.bulk_write([self.make_payout_op(payout)])
+
+        return payout
+
+    def make_payout_op(self, payout):
+        """Makes the MongoDB write operation that saves a Square Payout.
+
+        The payout is upserted, so saving the same payout twice, from
+        overlapping pulls or pages, is harmless.
+
+        Args:
+            payout: Square Payout object
+
+        Returns:
+            MongoDB write operation that upserts the Square Payout object.
+        """
         self.decode_payout(payout)
 
         # get payout properties
@@ -135,19 +239,14 @@ class Payouts(Connector):
         updated_at = payout.get('updated_at')
 
         # log the update
-        logger.debug('update_payout %s: %s', payout_id, updated_at.isoformat()[0:16])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('update_payout %s: %s',
+                payout_id, updated_at.strftime('%Y-%m-%dT%H:%M'))
 
         # apply payout customizations
         self.apply_payout_customizations(payout)
 
-        # update the database
-        self.collection.find_one_and_replace(
-            filter={'_id': payout_id},
-            replacement=payout,
-            upsert=True
-        )
-
-        return payout
+        return ReplaceOne({'_id': payout_id}, payout, upsert=True)
 
     def apply_payout_customizations(self, payout: dict) -> None:
         """Apply customizations to the Square Payout object.
@@ -191,7 +290,7 @@ class PayoutEntries(Connector):
         # initialize MongoDB collection
         self.collection = self.mdb.read_collection(self.collection_name)
         self.collection_raw = self.mdb.read_collection(self.collection_name_raw)
-        self.location_ids = os.environ.get('SQUARE_LOCATIONS').split(',')
+        self.location_ids = self.get_location_ids()
 
     def pull(self, payout_id: str) -> None:
         """Retrieves/processes a set of Square Payout Entries and saves them in MongoDB.
@@ -199,23 +298,31 @@ class PayoutEntries(Connector):
         Args:
             payout_id (str): Payout identifier.
         """
-        # read the payout entries
-        payout_entries = self.read(payout_id)
+        self.save(self.iter_payout_entries(payout_id))
 
-        # end if no payout entries
-        if not payout_entries or len(payout_entries) == 0:
-            logger.debug('payout entries processed: 0')
-            return
+    def save(self, payout_entries) -> None:
+        """Processes a set of Square Payout Entries and saves them in MongoDB.
 
+        The payout entries are saved in bulk writes of BATCH_SIZE entries.
+
+        Args:
+            payout_entries: List or iterator of Square Payout Entries.
+        """
         update_count = 0
-        for payout in tqdm(payout_entries, desc='payout_entries'):
+        ops = []
+        for payout in tqdm(payout_entries, desc='payout_entries', disable=None):
             # update payout
-            self.update_payout_entry(payout)
+            ops.append(self.make_payout_entry_op(payout))
             update_count += 1
+            if len(ops) >= BATCH_SIZE:
+                self.flush_batch(self.collection, ops)
 
             # debug, only process one payout
             # break
 
+        # save the remaining payout entries
+        self.flush_batch(self.collection, ops)
+
         logger.debug('payout entries processed: %s', update_count)
 
     def read(self, payout_id: str) -> list:
@@ -227,34 +334,23 @@ class PayoutEntries(Connector):
         Returns:
             list: List of Square Payout Entries.
         """
-        payout_entries = []
-
-        result = self.api_payouts.list_payout_entries(
-            payout_id=payout_id,
-            sort_order='ASC'
-        )
-
-        if result.is_success():
-            while result.body != {}:
-                payout_entries.extend(result.body['payout_entries'])
-
-                if result.cursor:
-                    result = self.api_payouts.list_payout_entries(
-                        payout_id=payout_id,
-                        sort_order='ASC',
-                        cursor=result.cursor
-                    )
-                else:
-                    break
-
-        elif result.is_error():
-            for error in result.errors:
-                logger.error(
-                    'error reading payout entries: %s, %s\n%s',
-                    error['category'], error['code'], error['detail']
-                )
-
-        return payout_entries
+        return list(self.iter_payout_entries(payout_id))
+
+    def iter_payout_entries(self, payout_id: str):
+        """Yields a set of Square Payout Entries, page by page.
+
+        Args:
+            payout_id (str): Payout identifier.
+
+        Yields:
+            Square Payout Entries.
+        """
+        # read every page, requesting the next page in the background
+        for page in self.list_pages(
+                self.api_payouts.list_payout_entries, 'payout_entries',
+                payout_id=payout_id,
+                sort_order='ASC'):
+            yield from page
 
     def update_payout_entry(self, payout_entry):
         """Save the provided Square Object into MongoDB.
@@ -265,6 +361,19 @@ class PayoutEntries(Connector):
         Returns:
             The MongoDB representation of the Square Payout Entry object.
         """
+        self.collection.bulk_write([self.make_payout_entry_op(payout_entry)])
+
+        return payout_entry
+
+    def make_payout_entry_op(self, payout_entry):
+        """Makes the MongoDB write operation that saves a Square Payout Entry.
+
+        Args:
+            payout_entry: Square Payout Entry object
+
+        Returns:
+            MongoDB write operation that upserts the Square Payout Entry object.
+        """
         self.decode_payout_entry(payout_entry)
 
         # get properties
@@ -276,14 +385,7 @@ class PayoutEntries(Connector):
         # apply payout customizations
         self.apply_payout_entry_customizations(payout_entry)
 
-        # update the database
-        self.collection.find_one_and_replace(
-            filter={'_id': payout_entry_id},
-            replacement=payout_entry,
-            upsert=True
-        )
-
-        return payout_entry
+        return ReplaceOne({'_id': payout_entry_id}, payout_entry, upsert=True)
 
     def apply_payout_entry_customizations(self, payout_entry: dict):
         """Apply customizations to the Square Payout Entry object.
@@ -1,18 +1,80 @@
 """Accounting sales data functions.
 """
-from datetime import datetime
+# the pipeline of each report section is built next to its result setter, so
+# a section can be read in one place, which makes the module long
+# pylint: disable=too-many-lines
+from concurrent.futures import ThreadPoolExecutor
 
 from aracnid_logger import Logger
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from i_mongodb import MongoDBInterface
+from pymongo.errors import OperationFailure
+
+from squaredown.indexes import ITEMIZATION_INDEX, ORDER_INDEX
 
 
 # initialize logging
 logger = Logger(__name__).get_logger()
 
-
-class ReportData():
+# number of grouped documents read per batch from multi-row aggregations
+AGGREGATE_BATCH_SIZE = 1000
+
+# maximum time in milliseconds that a report query may run on the server
+REPORT_MAX_TIME_MS = 30000
+
+# codec options that leave the grouped documents undecoded until read
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+# names of the line items that sell gift cards
+GIFT_CARD_NAMES = ['Gift Card', 'eGift Card']
+
+# order fields referenced by the order report sections
+ORDER_REPORT_PROJECTION = {
+    'created_at': 1,
+    'state': 1,
+    'line_items.name': 1,
+    'line_items.gross_sales_money.amount': 1,
+    'line_items.total_discount_money.amount': 1,
+    'line_items.total_tax_money.amount': 1,
+    'total_tip_money.amount': 1,
+    'service_charges.name': 1,
+    'service_charges.total_money.amount': 1,
+    'refunds.tender_id': 1,
+    'returns.return_line_items.item_type': 1,
+    'returns.return_line_items.gross_return_money.amount': 1,
+    'returns.return_line_items.variation_total_price_money.amount': 1,
+    'returns.return_line_items.return_modifiers.total_price_money.amount': 1,
+    'returns.return_line_items.total_discount_money.amount': 1,
+    'returns.return_line_items.total_tax_money.amount': 1,
+    'return_amounts': 1,
+}
+
+
+# each report section has a pipeline builder and a result setter, which are
+# public so they can be overridden and tested without MongoDB
+class ReportData():  # pylint: disable=too-many-public-methods
     """ReportData class.
+
+    Every report query is limited to REPORT_MAX_TIME_MS on the server, and
+    the aggregations are not allowed to spill to disk, so a pathological
+    timespan fails instead of stalling the report.
+
+    Reports only read MongoDB. The indexes used by the report pipelines are
+    created by the order and payout pulls, see squaredown.indexes. The order
+    and itemization facets hint their indexes, and run without the hint when
+    the index does not exist yet, e.g., before the first pull on a database.
+
+    Attributes:
+        data: Report data for the timespan.
+        end: End of the timespan.
+        mdb: MongoDB database with the Square collections.
+        start: Start of the timespan.
     """
+
+    # default MongoDB database, shared by all reports
+    _mdb = None
+
     def __init__(self, mdb=None) -> None:
         """Initializes the ReportData class.
 
@@ -22,34 +84,84 @@ class ReportData():
         # initialize MongoDB interface
         self.mdb = mdb
         if not mdb:
-            self.mdb = MongoDBInterface().get_mdb()
+            self.mdb = self.get_mdb()
 
         # initialize data
         self.data = {}
+        self.start = None
+        self.end = None
+
+    @staticmethod
+    def get_mdb():
+        """Returns the default MongoDB database of the reports.
+
+        The database is only resolved the first time it is requested in this
+        process, so reports created without a database share it.
+
+        Returns:
+            The MongoDB database with the Square collections.
+        """
+        if ReportData._mdb is None:
+            ReportData._mdb = MongoDBInterface().get_mdb()
+
+        return ReportData._mdb
 
     def get_data(self, start=None, end=None):
         """Retrieves the report data form MongoDB for the given timespan.
+
+        Args:
+            start: Start of the timespan.
+            end: End of the timespan.
+
+        Returns:
+            The report data for the timespan.
+        """
+        # an empty timespan has nothing to aggregate
+        if start >= end:
+            return self.init_data(start, end)
+
+        return self.calculate_data(start, end)
+
+    def calculate_data(self, start, end):
+        """Aggregates the report data from MongoDB for the given timespan.
+
+        The sections of the report are aggregated concurrently. Sections that
+        update the same values are run in order, in the same thread. Each
+        section builds its pipelines in separate methods and applies the
+        results with setters that take them, so the setters can be used
+        without MongoDB.
+
+        Args:
+            start: Start of the timespan.
+            end: End of the timespan.
+
+        Returns:
+            The report data for the timespan.
         """
         # initialize data
         self.data = self.init_data(start, end)
 
-        # calculate sales
-        self.set_sales_data()
-        self.set_gift_card_sales_data()
-        self.set_processing_fee()
-        self.set_category_sales_data()
-        self.set_collected_sales_data()
-        self.set_service_charge_data()
+        # sections that can be calculated independently
+        section_groups = [
+            # calculate sales and refunds from the orders
+            (self.set_orders_data,),
+            (self.set_processing_fee,),
+            (self.set_tender_data,),
+            (self.set_processing_fee_refund,),
+
+            # calculate category sales and refunds, which add categories,
+            # and the cost of sales
+            (self.set_itemization_data,),
+        ]
 
-        # calculate refunds
-        #set_gift_card_refund_data()
-        self.set_refund_data()
-        self.set_processing_fee_refund()
-        self.set_category_refund_data()
-        self.set_collected_refund_data()
+        def set_sections(sections):
+            for set_section in sections:
+                set_section()
 
-        # calculate cost
-        self.set_cost_sales_data()
+        with ThreadPoolExecutor(max_workers=len(section_groups)) as executor:
+            for future in [executor.submit(set_sections, sections)
+                           for sections in section_groups]:
+                future.result()
 
         self.calculate_net()
 
@@ -65,6 +177,9 @@ class ReportData():
         Returns:
             A structured data dictionary for the accounting report.
         """
+        self.start = start
+        self.end = end
+
         self.data = {
             'timespan': {
                 'start': start.isoformat(),
@@ -102,72 +217,169 @@ class ReportData():
 
         return self.data
 
-    def set_gift_card_sales_data(self):
-        """Sets the gift card sales data from MongoDB for the given timespan.
+    @staticmethod
+    def aggregate_one(collection, pipeline, hint=None):
+        """Returns the single result of an aggregation pipeline.
 
-        Note: There may be an issues with tips on gift card sales.
+        The pipeline is limited to one document, which is read in a batch of
+        one, rather than reading the default first batch into a list.
+
+        MongoDB rejects a hint for an index that does not exist, which is the
+        case until a pull has created the indexes of the database. The
+        pipeline is then run again without the hint.
+
+        Args:
+            collection: MongoDB collection to aggregate.
+            pipeline: Aggregation pipeline that results in one document.
+            hint: Optional index key pattern that the pipeline should use.
+
+        Returns:
+            The resulting document, or None if there is no result.
+        """
+        kwargs = {}
+        if hint:
+            kwargs['hint'] = hint
+
+        pipeline = [*pipeline, {'$limit': 1}]
+        try:
+            cursor = collection.aggregate(
+                pipeline=pipeline, batchSize=1, allowDiskUse=False,
+                maxTimeMS=REPORT_MAX_TIME_MS, **kwargs)
+            return next(cursor, None)
+        except OperationFailure as err:
+            if not hint or 'hint' not in str(err):
+                raise
+
+        logger.warning(f'Index {hint} is missing on {collection.name}, '
+                       'run a pull to create it')
+        cursor = collection.aggregate(
+            pipeline=pipeline, batchSize=1, allowDiskUse=False,
+            maxTimeMS=REPORT_MAX_TIME_MS)
+
+        return next(cursor, None)
+
+    @staticmethod
+    def aggregate_raw(collection, pipeline):
+        """Returns a cursor over the raw results of an aggregation pipeline.
+
+        The results are returned as RawBSONDocument objects, so only the
+        fields that are read are decoded. This suits the multi-row grouped
+        results, of which only the name and amount are read.
+
+        Args:
+            collection: MongoDB collection to aggregate.
+            pipeline: Aggregation pipeline.
+
+        Returns:
+            Cursor over the raw resulting documents.
+        """
+        return collection.with_options(codec_options=RAW_CODEC_OPTIONS).aggregate(
+            pipeline=pipeline, batchSize=AGGREGATE_BATCH_SIZE,
+            allowDiskUse=False, maxTimeMS=REPORT_MAX_TIME_MS)
+
+    @staticmethod
+    def sum_by_name(results, amount_field, default_name=None):
+        """Sums the amounts of grouped results by their lowercased name.
+
+        Args:
+            results: Aggregation results grouped by name.
+            amount_field: Name of the amount field of the results.
+            default_name: Name used for results without a name.
+
+        Returns:
+            Dictionary of the summed amounts keyed by lowercased name.
+        """
+        amounts = {}
+        for result in results:
+            name = (result['_id'] or default_name).lower()
+            amounts[name] = amounts.get(name, 0) + result[amount_field]
+
+        return amounts
+
+    def timespan_match(self):
+        """Returns the MongoDB match condition of the report timespan.
+
+        Returns:
+            Match condition for the datetime fields in the timespan.
+        """
+        return {'$gte': self.start, '$lt': self.end}
+
+    def set_orders_data(self):
+        """Sets the report sections that are aggregated from the Square Orders.
+
+        The orders of the timespan are matched once, using the index, and every
+        section is aggregated from them in its own facet, so the collection is
+        only traversed once. Only the order fields that the sections reference
+        are passed to the facets. The results are applied in order, since the
+        service charges and the refunds add to the sales and refund totals.
         """
+        # order sections, in the order their results are applied
+        sections = {
+            'sales': (self.sales_pipeline, self.set_sales_data),
+            'gift_card': (
+                self.gift_card_sales_pipeline, self.set_gift_card_sales_data),
+            'tips': (self.tip_pipeline, self.set_tip_data),
+            'service_charges': (
+                self.service_charge_pipeline, self.set_service_charge_data),
+
+            # refunds
+            #set_gift_card_refund_data()
+            'refund_returns': (
+                self.refund_returns_pipeline, self.set_refund_data_returns),
+            'refund_returns_custom': (
+                self.refund_returns_custom_pipeline,
+                self.set_refund_data_returns_custom),
+            'refund_tips': (
+                self.refund_tips_pipeline, self.set_refund_data_tips),
+            'collected_refunds': (
+                self.collected_refund_pipeline, self.set_collected_refund_data),
+        }
+
         pipeline = [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
-                    'state': 'COMPLETED'
-                }
-            }, {
-                '$unwind': {
-                    'path': '$line_items',
-                    'includeArrayIndex': 'line_item_index',
-                    'preserveNullAndEmptyArrays': False
-                }
-            }, {
-                '$match': {
-                    'line_items.name': {'$in': ['Gift Card', 'eGift Card']}
-                }
-            }, {
-                '$addFields': {
-                    'gross_sales_money': '$line_items.gross_sales_money',
-                    'discount_money': '$line_items.total_discount_money',
-                    'tax_money': '$line_items.total_tax_money'
+                    'created_at': self.timespan_match(),
+                    'state': {'$in': ['COMPLETED', 'OPEN']}
                 }
             }, {
-                '$unset': [
-                    'fulfillments',
-                    'net_amounts',
-                    'total_discount_money',
-                    'total_money',
-                    'total_tax_money'
-                ]
+                '$project': ORDER_REPORT_PROJECTION
             }, {
-                '$set': {
-                    'total_tip_money.amount': {
-                        '$cond': {
-                            'if': {
-                                '$gt': [
-                                    '$line_item_index', 0
-                                ]
-                            },
-                            'then': 0,
-                            'else': '$total_tip_money.amount'
-                        }
-                    }
+                '$facet': {
+                    name: get_pipeline()
+                    for name, (get_pipeline, _) in sections.items()
                 }
-            }, {
+            }
+        ]
+
+        facets = self.aggregate_one(
+            self.mdb.square_orders, pipeline, hint=ORDER_INDEX)
+        if not facets:
+            return
+
+        for name, (_, set_section) in sections.items():
+            set_section(facets[name])
+
+    def line_item_totals_stages(self):
+        """Returns the aggregation stages that total the unwound line items.
+
+        The amounts are summed from the line items directly, without reshaping
+        the unwound documents.
+
+        Returns:
+            Aggregation stages that group the line items into one total.
+        """
+        return [
+            {
                 '$group': {
                     '_id': None,
                     'total_gross_sales_money_amount': {
-                        '$sum': '$gross_sales_money.amount'
+                        '$sum': '$line_items.gross_sales_money.amount'
                     },
                     'total_discount_money_amount': {
-                        '$sum': '$discount_money.amount'
+                        '$sum': '$line_items.total_discount_money.amount'
                     },
                     'total_tax_money_amount': {
-                        '$sum': '$tax_money.amount'
-                    },
-                    'total_tip_money_amount': {
-                        '$sum': '$total_tip_money.amount'
+                        '$sum': '$line_items.total_tax_money.amount'
                     }
                 }
             }, {
@@ -179,155 +391,188 @@ class ReportData():
                         ]
                     }
                 }
-            }, {
-                '$addFields': {
-                    'total_collected_money_amount': {
-                        '$add': [
-                            '$total_net_sales_money_amount',
-                            '$total_tax_money_amount',
-                            '$total_tip_money_amount'
-                        ]
-                    }
-                }
             }
         ]
 
-        results = list(self.mdb.square_orders.aggregate(pipeline=pipeline))
-        if results:
-            self.data['summary']['gift_card']['sales'] = (
-                results[0]['total_gross_sales_money_amount']
-            )
+    def line_item_sales_pipeline(self, item_match):
+        """Returns the aggregation pipeline of the line item sales.
 
-            # add any tip amounts
-            self.data['summary']['tip']['sales'] += (
-                results[0]['total_tip_money_amount']
-            )
-
-            # add any gift card discounts
-            self.data['summary']['discount']['sales'] -= (
-                results[0]['total_discount_money_amount']
-            )
-            self.data['summary']['net']['sales'] -= (
-                results[0]['total_discount_money_amount']
-            )
-
-    def set_sales_data(self):
-        """Get the sales data from MongoDB for the given timespan.
+        Args:
+            item_match: Match condition of the unwound line items to total.
 
-        Note: Gift card itemizations are filtered out.
+        Returns:
+            Aggregation pipeline over the Square Orders.
         """
-        pipeline = [
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'state': {'$in': ['COMPLETED', 'OPEN']}
                 }
             }, {
                 '$unwind': {
                     'path': '$line_items',
-                    'includeArrayIndex': 'line_item_index',
                     'preserveNullAndEmptyArrays': False
                 }
             }, {
+                '$match': item_match
+            },
+            *self.line_item_totals_stages()
+        ]
+
+    def sales_pipeline(self):
+        """Returns the aggregation pipeline of the sales, without gift card
+        itemizations.
+
+        Returns:
+            Aggregation pipeline over the Square Orders.
+        """
+        return self.line_item_sales_pipeline({
+            'line_items.name': {'$nin': GIFT_CARD_NAMES}
+        })
+
+    def gift_card_sales_pipeline(self):
+        """Returns the aggregation pipeline of the gift card sales.
+
+        Returns:
+            Aggregation pipeline over the Square Orders.
+        """
+        return self.line_item_sales_pipeline({
+            'state': 'COMPLETED',
+            'line_items.name': {'$in': GIFT_CARD_NAMES}
+        })
+
+    def tip_pipeline(self):
+        """Returns the aggregation pipeline of the tips on sales.
+
+        The tip of each order is read once, without unwinding its line items.
+        An order's tip is counted with its first line item, so the tips of
+        orders that start with a gift card are only counted once completed.
+
+        Returns:
+            Aggregation pipeline over the Square Orders.
+        """
+        return [
+            {
                 '$match': {
-                    'line_items.name': {'$nin': ['Gift Card', 'eGift Card']}
+                    'created_at': self.timespan_match(),
+                    'state': {'$in': ['COMPLETED', 'OPEN']},
+                    'line_items.0': {'$exists': True}
                 }
             }, {
-                '$addFields': {
-                    'gross_sales_money': '$line_items.gross_sales_money',
-                    'discount_money': '$line_items.total_discount_money',
-                    'tax_money': '$line_items.total_tax_money'
-                }
-            }, {
-                '$unset': [
-                    'fulfillments',
-                    'net_amounts',
-                    'total_discount_money',
-                    'total_money',
-                    'total_tax_money'
-                ]
-            }, {
-                '$set': {
-                    'total_tip_money.amount': {
-                        '$cond': {
-                            'if': {
-                                '$gt': [
-                                    '$line_item_index', 0
+                '$match': {
+                    '$expr': {
+                        '$or': [
+                            {'$eq': ['$state', 'COMPLETED']},
+                            {'$not': [{
+                                '$in': [
+                                    {'$let': {
+                                        'vars': {
+                                            'first_item': {
+                                                '$arrayElemAt': ['$line_items', 0]
+                                            }
+                                        },
+                                        'in': '$$first_item.name'
+                                    }},
+                                    GIFT_CARD_NAMES
                                 ]
-                            },
-                            'then': 0,
-                            'else': '$total_tip_money.amount'
-                        }
+                            }]}
+                        ]
                     }
                 }
             }, {
                 '$group': {
                     '_id': None,
-                    'total_gross_sales_money_amount': {
-                        '$sum': '$gross_sales_money.amount'
-                    },
-                    'total_discount_money_amount': {
-                        '$sum': '$discount_money.amount'
-                    },
-                    'total_tax_money_amount': {
-                        '$sum': '$tax_money.amount'
-                    },
                     'total_tip_money_amount': {
                         '$sum': '$total_tip_money.amount'
                     }
                 }
-            }, {
-                '$addFields': {
-                    'total_net_sales_money_amount': {
-                        '$subtract': [
-                            '$total_gross_sales_money_amount',
-                            '$total_discount_money_amount'
-                        ]
-                    }
-                }
-            }, {
-                '$addFields': {
-                    'total_collected_money_amount': {
-                        '$add': [
-                            '$total_net_sales_money_amount',
-                            '$total_tax_money_amount',
-                            '$total_tip_money_amount'
-                        ]
-                    }
-                }
             }
         ]
 
-        results = list(self.mdb.square_orders.aggregate(pipeline=pipeline))
+    def set_sales_data(self, results):
+        """Sets the sales data of the timespan, without gift card
+        itemizations.
+
+        Args:
+            results: Aggregation results of the pipeline.
+        """
+        summary = self.data['summary']
+
         if results:
             sales_data = results[0]
 
-            self.data['summary']['gross']['sales'] = (
+            summary['gross']['sales'] = (
                 sales_data['total_gross_sales_money_amount']
             )
-            self.data['summary']['discount']['sales'] = (
+            summary['discount']['sales'] = (
                 -sales_data['total_discount_money_amount']
             )
-            self.data['summary']['net']['sales'] = (
+            summary['net']['sales'] = (
                 sales_data['total_net_sales_money_amount']
             )
-            self.data['summary']['tax']['sales'] = sales_data['total_tax_money_amount']
-            self.data['summary']['tip']['sales'] = sales_data['total_tip_money_amount']
+            summary['tax']['sales'] = sales_data['total_tax_money_amount']
+
+    def set_gift_card_sales_data(self, results):
+        """Sets the gift card sales data of the timespan.
+
+        Note: There may be an issues with tips on gift card sales.
+
+        Args:
+            results: Aggregation results of the pipeline.
+        """
+        summary = self.data['summary']
+
+        if results:
+            gift_card_data = results[0]
+
+            summary['gift_card']['sales'] = (
+                gift_card_data['total_gross_sales_money_amount']
+            )
+
+            # add any gift card discounts
+            summary['discount']['sales'] -= (
+                gift_card_data['total_discount_money_amount']
+            )
+            summary['net']['sales'] -= (
+                gift_card_data['total_discount_money_amount']
+            )
+
+    def set_tip_data(self, results):
+        """Sets the tips on the sales of the timespan, including gift cards.
+
+        Args:
+            results: Aggregation results of the pipeline.
+        """
+        if results:
+            self.data['summary']['tip']['sales'] += (
+                results[0]['total_tip_money_amount']
+            )
 
     def set_processing_fee(self):
-        """Get the total processing fees from MongoDB for the given timespan.
+        """Sets the total processing fees of the timespan.
         """
         # get the credit card processing fees
-        pipeline = [
+        self.set_processing_fee_data(self.aggregate_one(
+            self.mdb.square_payments, self.processing_fee_pipeline()))
+
+        # get gift card load fees
+        self.set_gift_card_load_data(self.aggregate_one(
+            self.mdb.square_payout_entries, self.gift_card_load_pipeline()))
+
+    def processing_fee_pipeline(self):
+        """Returns the aggregation pipeline of the processing fees.
+
+        The pipeline applies to both the Square Payments and the Square
+        Refunds.
+
+        Returns:
+            Aggregation pipeline over the Square Payments or Refunds.
+        """
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'status': 'COMPLETED'
                 }
             }, {
@@ -343,19 +588,17 @@ class ReportData():
                 }
             }
         ]
-        results = list(self.mdb.square_payments.aggregate(pipeline=pipeline))
-        if results:
-            # set the fees in the data structure
-            self.data['summary']['fee']['sales'] = -results[0]['amount']
 
-        # get gift card load fees
-        pipeline = [
+    def gift_card_load_pipeline(self):
+        """Returns the aggregation pipeline of the gift card load fees.
+
+        Returns:
+            Aggregation pipeline over the Square Payout Entries.
+        """
+        return [
             {
                 '$match': {
-                    'effective_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    }, 
+                    'effective_at': self.timespan_match(),
                     'type': 'OTHER'
                 }
             }, {
@@ -367,29 +610,69 @@ class ReportData():
                 }
             }
         ]
-        results = list(self.mdb.square_payout_entries.aggregate(pipeline=pipeline))
-        if results:
-            # set the fees in the data structure
-            self.data['summary']['gift_card_load']['sales'] = results[0]['amount']
 
-    def set_category_sales_data(self):
-        """Get the category sales data from MongoDB for the given timespan.
+    def set_processing_fee_data(self, fee_data):
+        """Sets the processing fees on the sales of the timespan.
+
+        Args:
+            fee_data: Aggregation result of the processing fees.
+        """
+        if fee_data:
+            self.data['summary']['fee']['sales'] = -fee_data['amount']
+
+    def set_gift_card_load_data(self, fee_data):
+        """Sets the gift card load fees of the timespan.
+
+        Args:
+            fee_data: Aggregation result of the gift card load fees.
+        """
+        if fee_data:
+            self.data['summary']['gift_card_load']['sales'] = fee_data['amount']
+
+    def set_itemization_data(self):
+        """Sets the category sales, refunds and cost of sales of the timespan.
+
+        The itemizations of the timespan are matched once, and the category
+        sales, the category refunds and the cost of sales are grouped from
+        them in separate facets. The sales are applied before the refunds,
+        since both add categories to the report.
         """
         pipeline = [
             {
                 '$match': {
-                    'order_created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
-                    'order_state': {'$in': ['COMPLETED', 'OPEN']},
-                    'category_name': {'$exists': 1}
+                    'order_created_at': self.timespan_match(),
+                    'order_state': {'$in': ['COMPLETED', 'OPEN']}
                 }
             }, {
-                '$addFields': {
-                    'category_name': {
-                        '$toLower': '$category_name'
-                    }
+                '$facet': {
+                    'sales': self.category_sales_stages(),
+                    'refunds': self.category_refund_stages(),
+                    'cost': self.cost_sales_stages()
+                }
+            }
+        ]
+
+        facets = self.aggregate_one(
+            self.mdb.square_order_itemizations, pipeline, hint=ITEMIZATION_INDEX)
+        if not facets:
+            return
+
+        self.set_category_sales_data(facets['sales'])
+        self.set_category_refund_data(facets['refunds'])
+        self.set_cost_sales_data(facets['cost'])
+
+    def category_sales_stages(self):
+        """Returns the aggregation stages of the category sales.
+
+        The stages follow the match of the itemizations of the timespan.
+
+        Returns:
+            Aggregation stages over the Square Order Itemizations.
+        """
+        return [
+            {
+                '$match': {
+                    'category_name': {'$exists': 1}
                 }
             }, {
                 '$group': {
@@ -401,83 +684,107 @@ class ReportData():
             }
         ]
 
-        category_data = list(self.mdb.square_order_itemizations.aggregate(
-            pipeline=pipeline
-        ))
+    def category_refund_stages(self):
+        """Returns the aggregation stages of the category refunds.
 
-        total_category_sales = 0
-        for category in category_data:
-            # get the category name
-            category_name = category['_id']
-            if not category_name:
-                logger.error('Unknown category')
-                category_name = 'uncategorized'
-
-            # get the sales amount
-            category_amount = category['gross_sales_money_amount']
-            total_category_sales += category_amount
+        The stages follow the match of the itemizations of the timespan.
 
-            # initialize category, if necessary
-            if category_name not in self.data['category_sales']:
-                self.data['category_sales'][category_name] = {
-                    'sales': 0, 'refunds': 0, 'net': 0
+        Returns:
+            Aggregation stages over the Square Order Itemizations.
+        """
+        return [
+            {
+                '$match': {
+                    'category_name': {'$exists': 1},
+                    'itemization_type': 'return'
+                }
+            }, {
+                '$group': {
+                    '_id': '$category_name',
+                    'gross_return_money_amount': {
+                        '$sum': '$gross_return_money.amount'
+                    }
                 }
+            }
+        ]
+
+    def set_category_sales_data(self, category_data):
+        """Sets the category sales of the timespan.
+
+        Args:
+            category_data: Aggregation results of the category sales.
+        """
+        if any(not category['_id'] for category in category_data):
+            logger.error('Unknown category')
+        amounts = self.sum_by_name(
+            category_data, 'gross_sales_money_amount', 'uncategorized')
+
+        # set sales amount for each category, initializing it if necessary
+        category_sales = self.data['category_sales']
+        for category_name, category_amount in amounts.items():
+            category_sales.setdefault(
+                category_name, {'sales': 0, 'refunds': 0, 'net': 0}
+            )['sales'] = category_amount
 
-            # set sales amount for the category
-            self.data['category_sales'][category_name]['sales'] = category_amount
-        
         # set the total sales amount
-        self.data['category_sales']['total']['sales'] = total_category_sales
+        category_sales['total']['sales'] = sum(amounts.values())
 
-    def set_collected_sales_data(self):
-        """Get the tender data from MongoDB for the given timespan.
+    def set_tender_data(self):
+        """Sets the collected sales of the timespan, by tender type.
         """
-        pipeline = [
+        self.set_collected_sales_data(self.aggregate_raw(
+            self.mdb.square_order_tenders, self.collected_sales_pipeline()))
+
+    def collected_sales_pipeline(self):
+        """Returns the aggregation pipeline of the sales by tender type.
+
+        Returns:
+            Aggregation pipeline over the Square Order Tenders.
+        """
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'order_state': {'$in': ['COMPLETED', 'OPEN']}
                 }
             }, {
                 '$group': {
-                    '_id': {
-                        '$toLower': '$type'
-                    },
+                    '_id': '$type',
                     'amount': {
                         '$sum': '$amount_money.amount'
                     }
                 }
-            }, {
-                '$match': {
-                    '_id': {
-                        '$ne': 'no_sale'
-                    }
-                }
             }
         ]
 
-        tender_data = list(self.mdb.square_order_tenders.aggregate(pipeline=pipeline))
-        total_collected_sales = 0
-        for tender_type in tender_data:
-            tender_name = tender_type['_id']
-            tender_amount = tender_type['amount']
-            total_collected_sales += tender_amount
-            self.data['collected'][tender_name]['sales'] = tender_amount
-        self.data['collected']['total']['sales'] = total_collected_sales
+    def set_collected_sales_data(self, tender_data):
+        """Sets the sales tender data of the timespan.
 
-    def set_service_charge_data(self):
-        """Get the service charges from MongoDB for the given timespan.
+        Args:
+            tender_data: Aggregation results of the sales by tender type.
         """
-        pipeline = [
+        amounts = self.sum_by_name(tender_data, 'amount')
+        amounts.pop('no_sale', None)
+
+        # set sales amount for each tender type
+        collected = self.data['collected']
+        for tender_name, tender_amount in amounts.items():
+            collected[tender_name]['sales'] = tender_amount
+        collected['total']['sales'] = sum(amounts.values())
+
+    def service_charge_pipeline(self):
+        """Returns the aggregation pipeline of the service charges.
+
+        The gratuities are totaled in a single group, which also collects the
+        names of any other service charges, so they can be reported.
+
+        Returns:
+            Aggregation pipeline over the Square Orders.
+        """
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'state': {
                         '$in': [
                             'COMPLETED'
@@ -491,42 +798,80 @@ class ReportData():
                 }
             }, {
                 '$group': {
-                    '_id': '$service_charges.name', 
-                    'amount': {
-                        '$sum': '$service_charges.total_money.amount'
+                    '_id': None,
+                    'gratuity_amount': {
+                        '$sum': {
+                            '$cond': {
+                                'if': {'$eq': ['$service_charges.name', 'Gratuity']},
+                                'then': '$service_charges.total_money.amount',
+                                'else': 0
+                            }
+                        }
+                    },
+                    'unhandled_names': {
+                        '$addToSet': {
+                            '$cond': {
+                                'if': {'$eq': ['$service_charges.name', 'Gratuity']},
+                                'then': '$$REMOVE',
+                                'else': '$service_charges.name'
+                            }
+                        }
                     }
                 }
             }
         ]
 
-        results = list(self.mdb.square_orders.aggregate(pipeline=pipeline))
-        if results:
-            for service_charge in results:
-                service_charge_name = service_charge['_id']
-                if service_charge_name == 'Gratuity':
-                    self.data['summary']['tip']['sales'] += service_charge['amount']
-                else:
-                    logger.error('unhandled service charge found: %s', service_charge_name)
+    def set_service_charge_data(self, results):
+        """Sets the service charges of the timespan.
 
-    def set_refund_data(self):
-        """Get the refund data from MongoDB for the given timespan.
+        Args:
+            results: Aggregation results of the pipeline.
         """
-        self.set_refund_data_returns()
-        self.set_refund_data_returns_custom()
-        self.set_refund_data_tips()
+        if results:
+            service_charges = results[0]
+            self.data['summary']['tip']['sales'] += service_charges['gratuity_amount']
 
-    def set_refund_data_returns(self):
-        """Get the refund data from MongoDB for the given timespan.
+            for service_charge_name in service_charges['unhandled_names']:
+                logger.error('unhandled service charge found: %s', service_charge_name)
 
-        This function processes refunds from returns.
+    def refund_returns_pipeline(self):
+        """Returns the aggregation pipeline of the refunds from returns.
+
+        The totals of the return line items are computed within each return,
+        instead of unwinding the line items and their modifiers. Each line
+        item counts its price, discount and tax once per returned modifier,
+        plus the modifier prices, and the tip of a return is counted once per
+        modifier of its first line item, as it was with the unwound modifiers.
+
+        Returns:
+            Aggregation pipeline over the Square Orders.
         """
-        pipeline = [
+        def count_amount(amount_field):
+            # amount of the line item, once per unwound document
+            return {'$multiply': ['$$count', {'$ifNull': [amount_field, 0]}]}
+
+        # unwound documents of the line item, one per modifier or at least one
+        item_count = {
+            '$max': [1, {'$size': {'$ifNull': ['$$item.return_modifiers', []]}}]
+        }
+
+        # totals of the line item
+        item_totals = {
+            'count': '$$count',
+            'gross': {
+                '$add': [
+                    count_amount('$$item.variation_total_price_money.amount'),
+                    {'$sum': '$$item.return_modifiers.total_price_money.amount'}
+                ]
+            },
+            'discount': count_amount('$$item.total_discount_money.amount'),
+            'tax': count_amount('$$item.total_tax_money.amount')
+        }
+
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'state': {'$in': ['COMPLETED']},
                     'refunds': {
                         '$exists': 1
@@ -537,77 +882,45 @@ class ReportData():
                     'path': '$returns'
                 }
             }, {
-                '$unwind': {
-                    'path': '$returns.return_line_items',
-                    'includeArrayIndex': 'line_item_index'
-                }
-            }, {
-                '$unwind': {
-                    'path': '$returns.return_line_items.return_modifiers',
-                    'preserveNullAndEmptyArrays': True
-                }
-            }, {
-                '$addFields': {
-                    'base_refund_money': '$returns.return_line_items.variation_total_price_money',
-                    'modifier_refund_money': {
-                        '$ifNull': [
-                            '$returns.return_line_items.return_modifiers.total_price_money', {
-                                'amount': 0,
-                                'currency': 'USD'
-                            }
-                        ]
-                    },
-                    'discount_money': '$returns.return_line_items.total_discount_money',
-                    'tax_money': '$returns.return_line_items.total_tax_money'
-                }
-            }, {
-                '$addFields': {
-                    'gross_refund_money': {
-                        'amount': {
-                            '$add': [
-                                '$base_refund_money.amount', '$modifier_refund_money.amount'
-                            ]
-                        },
-                        'currency': 'USD'
-                    }
-                }
-            }, {
-                '$unset': [
-                    'fulfillments',
-                    'net_amounts',
-                    'total_discount_money',
-                    'total_money',
-                    'total_tax_money',
-                    'total_tip_money'
-                ]
-            }, {
-                '$set': {
-                    'tip_money.amount': {
-                        '$cond': {
-                            'if': {
-                                '$gt': [
-                                    '$line_item_index', 0
-                                ]
+                '$project': {
+                    'line_totals': {
+                        '$map': {
+                            'input': {
+                                '$ifNull': ['$returns.return_line_items', []]
                             },
-                            'then': 0,
-                            'else': '$return_amounts.tip_money.amount'
+                            'as': 'item',
+                            'in': {
+                                '$let': {
+                                    'vars': {'count': item_count},
+                                    'in': item_totals
+                                }
+                            }
                         }
-                    }
+                    },
+                    'tip_money_amount': '$return_amounts.tip_money.amount'
                 }
             }, {
                 '$group': {
                     '_id': None,
                     'total_gross_refund_money_amount': {
-                        '$sum': '$gross_refund_money.amount'
+                        '$sum': {'$sum': '$line_totals.gross'}
                     },
                     'total_discount_refund_money_amount': {
-                        '$sum': '$discount_money.amount'
+                        '$sum': {'$sum': '$line_totals.discount'}
                     },
                     'total_tax_refund_money_amount': {
-                        '$sum': '$tax_money.amount'
+                        '$sum': {'$sum': '$line_totals.tax'}
                     },
                     'total_tip_refund_money_amount': {
-                        '$sum': '$tip_money.amount'
+                        # count the tip of a return with its first line item
+                        '$sum': {
+                            '$multiply': [
+                                {'$ifNull': ['$tip_money_amount', 0]},
+                                {'$ifNull': [
+                                    {'$arrayElemAt': ['$line_totals.count', 0]}, 0
+                                ]}
+                            ]
+                        }
                     }
                 }
             }, {
@@ -632,39 +945,45 @@ class ReportData():
             }
         ]
 
-        results = list(self.mdb.square_orders.aggregate(pipeline=pipeline))
+    def set_refund_data_returns(self, results):
+        """Sets the refund data of the timespan.
+
+        This function processes refunds from returns.
+
+        Args:
+            results: Aggregation results of the pipeline.
+        """
+        summary = self.data['summary']
 
         if results:
             refund_data = results[0]
             if refund_data:
-                self.data['summary']['gross']['refunds'] = (
+                summary['gross']['refunds'] = (
                     -refund_data['total_gross_refund_money_amount']
                 )
-                self.data['summary']['discount']['refunds'] = (
+                summary['discount']['refunds'] = (
                     refund_data['total_discount_refund_money_amount']
                 )
-                self.data['summary']['net']['refunds'] = (
+                summary['net']['refunds'] = (
                     -refund_data['total_net_refund_money_amount']
                 )
-                self.data['summary']['tax']['refunds'] = (
+                summary['tax']['refunds'] = (
                     -refund_data['total_tax_refund_money_amount']
                 )
-                self.data['summary']['tip']['refunds'] = (
+                summary['tip']['refunds'] = (
                     -refund_data['total_tip_refund_money_amount']
                 )
 
-    def set_refund_data_returns_custom(self):
-        """Get the custom refund data from MongoDB for the given timespan.
+    def refund_returns_custom_pipeline(self):
+        """Returns the aggregation pipeline of the custom refunds from returns.
 
-        This function processes custom refunds from returns.
+        Returns:
+            Aggregation pipeline over the Square Orders.
         """
-        pipeline = [
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'state': {
                         '$in': [
                             'COMPLETED'
@@ -697,8 +1016,14 @@ class ReportData():
             }
         ]
 
-        results = list(self.mdb.square_orders.aggregate(pipeline=pipeline))
+    def set_refund_data_returns_custom(self, results):
+        """Sets the custom refund data of the timespan.
 
+        This function processes custom refunds from returns.
+
+        Args:
+            results: Aggregation results of the pipeline.
+        """
         if results:
             refund_data = results[0]
             if refund_data:
@@ -706,19 +1031,16 @@ class ReportData():
                     -refund_data['total_gross_refund_money_amount']
                 )
 
-    def set_refund_data_tips(self):
-        """Get the refund data from MongoDB for the given timespan.
+    def refund_tips_pipeline(self):
+        """Returns the aggregation pipeline of the refunded tips without returned items.
 
-        This function finds the special case where a tip is refunded without
-        returning any items.
+        Returns:
+            Aggregation pipeline over the Square Orders.
         """
-        pipeline = [
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'state': {'$in': ['COMPLETED']},
                     'refunds': {'$exists': 1},
                     'returns.return_line_items': {'$exists': 0}
@@ -739,139 +1061,101 @@ class ReportData():
             }
         ]
 
-        results = list(self.mdb.square_orders.aggregate(pipeline=pipeline))
+    def set_refund_data_tips(self, results):
+        """Sets the refund data of the timespan.
+
+        This function finds the special case where a tip is refunded without
+        returning any items.
+
+        Args:
+            results: Aggregation results of the pipeline.
+        """
+        summary = self.data['summary']
 
         if results:
             refund_data = results[0]
             if refund_data:
-                self.data['summary']['discount']['refunds'] += (
+                summary['discount']['refunds'] += (
                     refund_data['total_discount_refund_money_amount']
                 )
-                self.data['summary']['net']['refunds'] += (
+                summary['net']['refunds'] += (
                     refund_data['total_discount_refund_money_amount']
                 )
-                self.data['summary']['tax']['refunds'] -= (
+                summary['tax']['refunds'] -= (
                     refund_data['total_tax_refund_money_amount']
                 )
-                self.data['summary']['tip']['refunds'] -= (
+                summary['tip']['refunds'] -= (
                     refund_data['total_tip_refund_money_amount']
                 )
 
     def set_processing_fee_refund(self):
-        """Get the total processing fees from MongoDB for the given timespan.
+        """Sets the total processing fee refunds of the timespan.
         """
-        pipeline = [
-            {
-                '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
-                    'status': 'COMPLETED'
-                }
-            }, {
-                '$unwind': {
-                    'path': '$processing_fee'
-                }
-            }, {
-                '$group': {
-                    '_id': None,
-                    'amount': {
-                        '$sum': '$processing_fee.amount_money.amount'
-                    }
-                }
-            }
-        ]
+        self.set_processing_fee_refund_data(self.aggregate_one(
+            self.mdb.square_refunds, self.processing_fee_pipeline()))
 
-        results = list(self.mdb.square_refunds.aggregate(pipeline=pipeline))
+    def set_processing_fee_refund_data(self, fee_data):
+        """Sets the processing fees on the refunds of the timespan.
 
-        if results:
-            self.data['summary']['fee']['refunds'] = -results[0]['amount']
-
-    def set_category_refund_data(self):
-        """Get the category return data from MongoDB for the given timespan.
+        Args:
+            fee_data: Aggregation result of the processing fees.
         """
-        pipeline = [
-            {
-                '$match': {
-                    'order_created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    }, 
-                    'order_state': {
-                        '$in': [
-                            'COMPLETED', 'OPEN'
-                        ]
-                    }, 
-                    'category_name': {
-                        '$exists': 1
-                    }, 
-                    'itemization_type': 'return'
-                }
-            }, {
-                '$addFields': {
-                    'category_name': {
-                        '$toLower': '$category_name'
-                    }
-                }
-            }, {
-                '$group': {
-                    '_id': '$category_name', 
-                    'gross_return_money_amount': {
-                        '$sum': '$gross_return_money.amount'
-                    }
-                }
-            }
-        ]
+        if fee_data:
+            self.data['summary']['fee']['refunds'] = -fee_data['amount']
 
-        category_return_data = list(self.mdb.square_order_itemizations.aggregate(
-            pipeline=pipeline
-        ))
-        total_category_returns = 0
-        for category in category_return_data:
-            # get the category name
-            category_name = category['_id']
-            if not category_name:
-                logger.error('Unknown category')
-                category_name = 'uncategorized'
+    def set_category_refund_data(self, category_return_data):
+        """Sets the category refunds of the timespan.
 
-            # get the refund amount
-            category_amount = category['gross_return_money_amount']
-            total_category_returns += category_amount
+        Args:
+            category_return_data: Aggregation results of the category refunds.
+        """
+        if any(not category['_id'] for category in category_return_data):
+            logger.error('Unknown category')
+        amounts = self.sum_by_name(
+            category_return_data, 'gross_return_money_amount', 'uncategorized')
+
+        # set refund amount for each category, initializing it if necessary
+        category_sales = self.data['category_sales']
+        for category_name, category_amount in amounts.items():
+            category_sales.setdefault(
+                category_name, {'sales': 0, 'refunds': 0, 'net': 0}
+            )['refunds'] = -category_amount
 
-            # initialize category, if necessary
-            if category_name not in self.data['category_sales']:
-                self.data['category_sales'][category_name] = {
-                    'sales': 0, 'refunds': 0, 'net': 0
-                }
+        # set the total refund amount
+        category_sales['total']['refunds'] = -sum(amounts.values())
 
-            # set refund amount for the category
-            self.data['category_sales'][category_name]['refunds'] = -category_amount
+    def collected_refund_pipeline(self):
+        """Returns the aggregation pipeline of the refunds by tender type.
 
-        # set the total refund amount
-        self.data['category_sales']['total']['refunds'] = -total_category_returns
+        The refunds are reduced to their tender identifiers and the refunds
+        without a tender are dropped before the tenders are looked up.
 
-    def set_collected_refund_data(self):
-        """Get the refund tender data from MongoDB for the given timespan.
+        Returns:
+            Aggregation pipeline over the Square Orders.
         """
-        pipeline = [
+        return [
             {
                 '$match': {
-                    'created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
+                    'created_at': self.timespan_match(),
                     'state': 'COMPLETED',
                     'return_amounts.total_money.amount': {
                         '$gt': 0
                     }
                 }
+            }, {
+                '$project': {
+                    'refunds.tender_id': 1,
+                    'return_amounts.total_money.amount': 1
+                }
             }, {
                 '$unwind': {
                     'path': '$refunds',
-                    'includeArrayIndex': 'refund_index',
                     'preserveNullAndEmptyArrays': False
                 }
+            }, {
+                '$match': {
+                    'refunds.tender_id': {'$ne': None}
+                }
             }, {
                 '$lookup': {
                     'from': 'square_order_tenders',
@@ -880,18 +1164,14 @@ class ReportData():
                     'as': 'square_order_tenders'
                 }
             }, {
+                # unwind the lookup output directly, so they run as one stage
                 '$unwind': {
-                    'path': '$square_order_tenders'
-                }
-            }, {
-                '$addFields': {
-                    'type': {
-                        '$toLower': '$square_order_tenders.type'
-                    }
+                    'path': '$square_order_tenders',
+                    'preserveNullAndEmptyArrays': False
                 }
             }, {
                 '$group': {
-                    '_id': '$type',
+                    '_id': '$square_order_tenders.type',
                     'amount': {
                         '$sum': '$return_amounts.total_money.amount'
                     }
@@ -899,55 +1179,63 @@ class ReportData():
             }
         ]
 
-        tender_data = list(self.mdb.square_orders.aggregate(pipeline=pipeline))
+    def set_collected_refund_data(self, results):
+        """Sets the refund tender data of the timespan.
 
-        total_collected_sales = 0
-        for tender_type in tender_data:
-            tender_name = tender_type['_id']
-            tender_amount = tender_type['amount']
-            total_collected_sales += tender_amount
-            self.data['collected'][tender_name]['refunds'] = -tender_amount
-        self.data['collected']['total']['refunds'] = -total_collected_sales
+        Args:
+            results: Aggregation results of the pipeline.
+        """
+        amounts = self.sum_by_name(results, 'amount')
+
+        # set refund amount for each tender type
+        collected = self.data['collected']
+        for tender_name, tender_amount in amounts.items():
+            collected[tender_name]['refunds'] = -tender_amount
+        collected['total']['refunds'] = -sum(amounts.values())
 
     def calculate_net(self):
         """Calculates the net value from the sales and the refunds.
         """
+        summary = self.data['summary']
+        collected_total = self.data['collected']['total']
+        net_total = summary['net_total']
+
         # calculate net total
-        self.data['summary']['net_total']['sales'] = (
-            self.data['collected']['total']['sales'] + self.data['summary']['fee']['sales']
-        )
+        net_total['sales'] = collected_total['sales'] + summary['fee']['sales']
 
         # calculate net total refund
-        self.data['summary']['net_total']['refunds'] = (
-            self.data['collected']['total']['refunds'] +
-            self.data['summary']['fee']['refunds']
+        net_total['refunds'] = (
+            collected_total['refunds'] + summary['fee']['refunds']
         )
 
         # calculate all net
         headings = ['summary', 'collected', 'category_sales', 'cost']
         for heading in headings:
-            subheadings = self.data[heading]
-            for sub in subheadings:
-                self.data[heading][sub]['net'] = (
-                    self.data[heading][sub]['sales'] + self.data[heading][sub]['refunds']
-                )
+            for values in self.data[heading].values():
+                values['net'] = values['sales'] + values['refunds']
 
-    def set_cost_sales_data(self):
-        """Get the cost sales data from MongoDB for the given timespan.
+    def cost_sales_stages(self):
+        """Returns the aggregation stages of the cost of sales by category.
+
+        The stages follow the match of the itemizations of the timespan.
+
+        Returns:
+            Aggregation stages over the Square Order Itemizations.
         """
-        pipeline = [
+        return [
             {
                 '$match': {
-                    'order_created_at': {
-                        '$gte': datetime.fromisoformat(self.data['timespan']['start']),
-                        '$lt': datetime.fromisoformat(self.data['timespan']['end'])
-                    },
                     'order_state': 'COMPLETED'
                 }
             }, {
                 '$unwind': {
                     'path': '$applied_costs'
                 }
+            }, {
+                # gift cards have no cost of sales
+                '$match': {
+                    'applied_costs.category': {'$ne': 'gift card'}
+                }
             }, {
                 '$group': {
                     '_id': '$applied_costs.category',
@@ -958,13 +1246,17 @@ class ReportData():
             }
         ]
 
+    def set_cost_sales_data(self, results):
+        """Sets the cost sales data of the timespan.
+
+        Args:
+            results: Aggregation results of the cost of sales by category.
+        """
+        cost = self.data['cost']
         total_cost_sales = 0
-        results = list(self.mdb.square_order_itemizations.aggregate(pipeline=pipeline))
         for category in results:
             # get the category name
             category_name = category['_id']
-            if category_name == 'gift card':
-                continue
             if not category_name:
                 logger.error('Unknown category')
                 category_name = 'uncategorized'
@@ -973,14 +1265,10 @@ class ReportData():
             category_amount = category['amount']
             total_cost_sales += category_amount
 
-            # initialize category, if necessary
-            if category_name not in self.data['cost']:
-                self.data['cost'][category_name] = {
-                    'sales': 0, 'refunds': 0, 'net': 0
-                }
-
-            # set cost amount for the category
-            self.data['cost'][category_name]['sales'] = category_amount
+            # set cost amount for the category, initializing it if necessary
+            cost.setdefault(
+                category_name, {'sales': 0, 'refunds': 0, 'net': 0}
+            )['sales'] = category_amount
 
         # set the total cost
-        self.data['cost']['total']['sales'] = total_cost_sales
+        cost['total']['sales'] = total_cost_sales
@@ -11,3 +11,10 @@ def test_init_catalog():
     assert catalog.api_catalog
     assert catalog.collection is not None
     assert catalog.props
+
+def test_get_object_type():
+    """Tests the Square Catalog object type lookup.
+    """
+    assert sqd.Catalog.get_object_type('square_catalog_items') == 'ITEM'
+    assert sqd.Catalog.get_object_type('square_catalog_modifier_lists') == 'MODIFIER_LIST'
+    assert sqd.Catalog.get_object_type('square_orders') is None
@@ -7,6 +7,7 @@ from aracnid_utils import timespan as ts
 import pytest
 
 import squaredown as sqd
+from squaredown.connector import parse_iso_datetime
 
 
 REF_BEGIN_STR = '2020-06-01T00:00:00-04:00'
@@ -14,7 +15,17 @@ REF_THRU_STR = '2020-06-08T00:00:00-04:00'
 REF_WEEK_STR = '2020-W49'
 
 
-@pytest.fixture(name='conn')
+def test_parse_iso_datetime():
+    """Tests that ISO-8601 datetime strings are parsed like the timespan function.
+    """
+    start, end = ts(begin_str=REF_BEGIN_STR, thru_str='2020-06-08T00:00:00')
+
+    assert parse_iso_datetime(REF_BEGIN_STR) == start
+    assert parse_iso_datetime('2020-06-08T00:00:00') == end
+    assert parse_iso_datetime(REF_WEEK_STR) is None
+    assert parse_iso_datetime('2020-06-08') is None
+
+@pytest.fixture(name='conn', scope='session')
 def fixture_connector():
     """Pytest fixture to initialize and return a Connector.
     """
@@ -23,6 +34,20 @@ def fixture_connector():
 
     return conn
 
+@pytest.fixture(name='conn_updated', scope='module')
+def fixture_connector_with_last_updated():
+    """Pytest fixture to return a Connector with last_updated in its config.
+
+    The configuration is saved once and shared by the tests that read it.
+    """
+    collection_name = '_test_collection_with_last_updated'
+    conn = sqd.Connector(collection_name)
+    last_updated = datetime(2019, 8, 5, 12, 34).astimezone()
+    conn.props.last_updated = last_updated
+    conn.props.update()
+
+    return conn
+
 def test_init_connector_square(conn):
     """Tests the Connector's Square initialization.
     """
@@ -54,17 +79,15 @@ def test_timespan_args_begin_str_and_thru_str(conn):
     assert isinstance(end, datetime)
     assert end.isoformat() == REF_THRU_STR
 
-def test_timespan_args_begin_str_missing_and_config():
-    """Tests Connector's timespan arguments: begin_str missing with config
+@pytest.mark.parametrize('kwargs', [
+    {'thru_str': REF_THRU_STR},
+    {'begin': None, 'thru_str': REF_THRU_STR},
+], ids=['begin_str_missing', 'begin_none'])
+def test_timespan_args_begin_and_config(conn_updated, kwargs):
+    """Tests Connector's timespan arguments: begin missing or None with config
     """
-    collection_name = '_test_collection_with_last_updated'
-    conn = sqd.Connector(collection_name)
-    last_updated = datetime(2019, 8, 5, 12, 34).astimezone()
-    conn.props.last_updated = last_updated
-    conn.props.update()
-
-    start, _ = conn.timespan(thru_str=REF_THRU_STR)
-    last_updated = conn.props.last_updated
+    start, _ = conn_updated.timespan(**kwargs)
+    last_updated = conn_updated.props.last_updated
 
     assert isinstance(start, datetime)
     assert start == last_updated
@@ -81,37 +104,15 @@ def test_timespan_args_begin_str_missing_and_no_config():
     assert isinstance(start, datetime)
     assert start.isoformat() == start_first.isoformat()
 
-def test_timespan_args_begin_none_and_config():
-    """Tests Connector's timespan arguments: begin is None with config
-    """
-    collection_name = '_test_collection_with_last_updated'
-    conn = sqd.Connector(collection_name)
-    last_updated = datetime(2019, 8, 5, 12, 34).astimezone()
-    conn.props.last_updated = last_updated
-    conn.props.update()
-
-    start, _ = conn.timespan(begin=None, thru_str=REF_THRU_STR)
-    last_updated = conn.props.last_updated
-
-    assert isinstance(start, datetime)
-    assert start == last_updated
-
-def test_timespan_args_week_str_and_config():
+def test_timespan_args_week_str_and_config(conn_updated):
     """Tests Connector's timespan arguments: week_str with config
 
     If the last_updated datetime is set in the config, it will override the start for a timespan.
     This tests that the start will NOT be overridden when week_str is specified.
     """
-    collection_name = '_test_collection_with_last_updated'
-    conn = sqd.Connector(collection_name)
-    last_updated = datetime(2019, 12, 19, 12, 34).astimezone()
-    conn.props.last_updated = last_updated
-    conn.props.update()
-
     week_start, _ = ts(week_str=REF_WEEK_STR)
 
-    start, _ = conn.timespan(week_str=REF_WEEK_STR)
-    last_updated = conn.props.last_updated
+    start, _ = conn_updated.timespan(week_str=REF_WEEK_STR)
 
     assert isinstance(start, datetime)
     assert start == week_start
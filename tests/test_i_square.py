@@ -3,12 +3,13 @@
 from datetime import datetime
 import os
 
+from dateutil.parser import parse
 import pytest
 
 from squaredown.i_square import SquareInterface
 
 
-@pytest.fixture(name='square_if')
+@pytest.fixture(name='square_if', scope='session')
 def fixture_square_iface():
     """Pytest fixture to initialize and return the SquareInterface object.
     """
@@ -58,3 +59,43 @@ def test_decode_datetime(square_if):
     assert isinstance(ref_dt, datetime)
     assert ref_dt.isoformat(timespec='milliseconds')[0:23] == ref_dt_str[0:23]
     assert ref_dt.isoformat(timespec='milliseconds')[-6:] == '+00:00'
+
+def test_decode_datetime_fast_path(square_if):
+    """Tests that the datetime fast path matches the generic parser.
+    """
+    for dt_str in ('2016-09-04T23:59:33Z', '2016-09-04T23:59:33.123Z',
+                   '2016-09-04T23:59:33.123456Z',
+                   '2016-09-04T18:59:33.123-05:00'):
+        assert square_if.decode_datetime(dt_str) == parse(dt_str)
+
+def test_decode_datetime_decoded(square_if):
+    """Tests that decoded datetimes are returned unchanged.
+    """
+    ref_dt = square_if.decode_datetime('2016-09-04T23:59:33.123Z')
+
+    assert square_if.decode_datetime(ref_dt) is ref_dt
+
+def test_list_pages():
+    """Tests that list pages follow the cursor of each page.
+    """
+    class Result:
+        """Minimal Square API result.
+        """
+        def __init__(self, body):
+            self.body = body
+            self.cursor = body.get('cursor')
+
+        def is_error(self):
+            return False
+
+    pages = {
+        None: Result({'payouts': [1, 2], 'cursor': 'a'}),
+        'a': Result({'payouts': [3]}),
+    }
+    def list_fn(sort_order, cursor=None):
+        assert sort_order == 'ASC'
+        return pages[cursor]
+
+    result = list(SquareInterface.list_pages(list_fn, 'payouts', sort_order='ASC'))
+
+    assert result == [[1, 2], [3]]
@@ -1,14 +1,37 @@
 """Test functions for orders.py.
 """
+from datetime import datetime, timezone
+
+import pytest
+
 import squaredown as sqd
+from squaredown.orders import Orders
 
-def test_init_orders():
-    """Tests that Orders() initializes successfully.
+
+@pytest.fixture(name='orders', scope='session')
+def fixture_orders():
+    """Pytest fixture to initialize and return an Orders connector.
     """
-    orders = sqd.Orders()
+    return sqd.Orders()
 
+def test_init_orders(orders):
+    """Tests that Orders() initializes successfully.
+    """
     assert orders
     assert orders.api_orders
     assert orders.collection is not None
     assert orders.location_ids
     assert orders.props
+
+def test_make_square_filter():
+    """Tests the Square Orders search filter.
+    """
+    start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    end = datetime(2021, 1, 2, tzinfo=timezone.utc)
+    square_filter = Orders.make_square_filter(['L1'], start, end)
+
+    assert square_filter['location_ids'] == ['L1']
+    updated_at = square_filter['query']['filter']['date_time_filter']['updated_at']
+    assert updated_at['start_at'] == '2021-01-01T00:00:00+00:00'
+    assert updated_at['end_at'] == '2021-01-02T00:00:00+00:00'
+    assert square_filter['query']['sort']['sort_order'] == 'ASC'
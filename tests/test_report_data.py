@@ -0,0 +1,81 @@
+"""Test functions for report_data.py.
+"""
+from datetime import datetime, timezone
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from squaredown.report_data import ReportData
+
+
+class FakeCollection():
+    """Collection without indexes, which rejects hinted aggregations.
+    """
+    name = 'fake'
+
+    def aggregate(self, pipeline, **kwargs):
+        """Returns the single result, unless an index is hinted.
+        """
+        if 'hint' in kwargs:
+            raise OperationFailure(
+                'hint provided does not correspond to an existing index', 2)
+
+        return iter([{'pipeline': pipeline}])
+
+
+class FakeDatabase():
+    """Database that is never queried by the tests.
+    """
+    name = 'fake'
+
+
+@pytest.fixture(name='report')
+def fixture_report():
+    """Pytest fixture to return a ReportData object with initialized data.
+    """
+    report = ReportData(mdb=FakeDatabase())
+    report.init_data(
+        datetime(2021, 1, 1, tzinfo=timezone.utc),
+        datetime(2021, 1, 2, tzinfo=timezone.utc))
+
+    return report
+
+def test_set_collected_sales_data(report):
+    """Tests that the tender types are lowercased and summed.
+    """
+    report.set_collected_sales_data([
+        {'_id': 'CARD', 'amount': 1000},
+        {'_id': 'CASH', 'amount': 500},
+        {'_id': 'NO_SALE', 'amount': 0},
+    ])
+
+    assert report.data['collected']['card']['sales'] == 1000
+    assert report.data['collected']['cash']['sales'] == 500
+    assert report.data['collected']['total']['sales'] == 1500
+
+def test_calculate_net(report):
+    """Tests that the net values add the sales and the refunds.
+    """
+    report.set_category_sales_data([{'_id': 'Beer', 'gross_sales_money_amount': 900}])
+    report.set_category_refund_data([{'_id': 'beer', 'gross_return_money_amount': 100}])
+    report.calculate_net()
+
+    assert report.data['category_sales']['beer']['net'] == 800
+    assert report.data['category_sales']['total']['net'] == 800
+
+def test_get_data_empty_timespan(report):
+    """Tests that an empty timespan is reported without querying MongoDB.
+    """
+    start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    data = report.get_data(start, start)
+
+    assert data['summary']['net_total'] == {'sales': 0, 'refunds': 0, 'net': 0}
+    assert data['timespan']['start'] == data['timespan']['end']
+
+def test_aggregate_one_missing_hint_index():
+    """Tests that a hint for a missing index is dropped.
+    """
+    result = ReportData.aggregate_one(
+        FakeCollection(), [{'$match': {}}], hint=[('state', 1)])
+
+    assert result == {'pipeline': [{'$match': {}}, {'$limit': 1}]}